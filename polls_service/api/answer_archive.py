@@ -0,0 +1,178 @@
+import os
+import pathlib
+import sqlite3
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .bulk import chunked
+from .models import Poll, UserPollAnswer, UserPollQuestionAnswer
+
+ARCHIVE_CHUNK_SIZE = 1000
+
+# answers are clustered by submission, history reads one range per submission
+ARCHIVE_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS submissions '
+    '(id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, isdelete INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS answers '
+    '(user_poll_id INTEGER NOT NULL, id INTEGER NOT NULL, question_id INTEGER, answer TEXT NOT NULL, '
+    'answer_id INTEGER, isdelete INTEGER NOT NULL, PRIMARY KEY (user_poll_id, id)) WITHOUT ROWID',
+]
+
+
+class ArchiveUnavailable(APIException):
+    """
+    Archive file of a poll with archived submissions is missing or unreadable
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Answer archive is unavailable.'
+    default_code = 'archive_unavailable'
+
+
+def archive_path(poll_id):
+    return os.path.join(settings.ANSWER_ARCHIVE_DIR, f'poll_{int(poll_id)}.sqlite3')
+
+
+def _connect(poll_id, write=False):
+    path = archive_path(poll_id)
+    if not write:
+        try:
+            return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro', uri=True, timeout=30)
+        except sqlite3.Error as e:
+            raise ArchiveUnavailable(f'Answer archive of poll {poll_id} is unavailable.') from e
+    os.makedirs(settings.ANSWER_ARCHIVE_DIR, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA synchronous=FULL')
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def archivable_polls(end_date):
+    """
+    Polls, deleted ones included, closed before end_date with submissions left in the hot tables
+    """
+    hot = UserPollAnswer.all_objects.filter(poll=OuterRef('pk'), archived=False)
+    return Poll.all_objects.filter(end_date__lt=end_date).filter(Exists(hot)).order_by('pk')
+
+
+def archive_chunk(poll_id, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Move answers of up to chunk_size hot submissions of the poll to its archive file,
+    return the number of archived submissions.
+
+    Answers are committed to the file before they are deleted from the hot table and the
+    submissions flagged as archived. Rows are written with INSERT OR REPLACE, a chunk
+    interrupted between the two steps is written again by the next run.
+    """
+    submissions = list(UserPollAnswer.all_objects.filter(poll_id=poll_id, archived=False).order_by('id')
+                       .values_list('id', 'user_id', 'isdelete')[:chunk_size])
+    if not submissions:
+        return 0
+    ids = [s[0] for s in submissions]
+    answers = []
+    for ids_chunk in chunked(ids):
+        answers.extend(UserPollQuestionAnswer.all_objects.filter(user_poll_id__in=ids_chunk).values_list(
+            'user_poll_id', 'id', 'question_id', 'answer', 'answer_id_id', 'isdelete'))
+    conn = _connect(poll_id, write=True)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO submissions VALUES (?, ?, ?)', submissions)
+            conn.executemany('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)', answers)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    with transaction.atomic():
+        for ids_chunk in chunked(ids):
+            UserPollQuestionAnswer.all_objects.filter(user_poll_id__in=ids_chunk).delete()
+            UserPollAnswer.all_objects.filter(id__in=ids_chunk).update(archived=True)
+    return len(ids)
+
+
+def archive_poll(poll_id, chunk_size=ARCHIVE_CHUNK_SIZE, progress=lambda archived: None):
+    """
+    Archive answers of all hot submissions of the poll chunk by chunk, return the number of archived submissions
+    """
+    archived = 0
+    while True:
+        count = archive_chunk(poll_id, chunk_size)
+        if not count:
+            return archived
+        archived += count
+        progress(archived)
+
+
+def archived_answers(poll_id, user_poll_ids):
+    """
+    Live archived answers of the poll submissions as (user_poll_id, question_id, answer, answer_id)
+    ordered by submission and answer id
+    """
+    conn = _connect(poll_id)
+    try:
+        rows = []
+        for ids_chunk in chunked(sorted(user_poll_ids)):
+            rows.extend(conn.execute(
+                'SELECT user_poll_id, question_id, answer, answer_id FROM answers '
+                f'WHERE isdelete = 0 AND user_poll_id IN ({", ".join("?" * len(ids_chunk))}) '
+                'ORDER BY user_poll_id, id', ids_chunk))
+        return rows
+    finally:
+        conn.close()
+
+
+def archived_answer_rows(poll_id, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Live answers of live archived submissions of the poll as (user_poll_id, user_id, question_id, answer,
+    answer_id) ordered by submission. The file is checked at once and read with a cursor by the thread
+    iterating the rows, submissions are checked in the hot table chunk by chunk.
+    """
+    _connect(poll_id).close()
+    return _live_rows(poll_id, chunk_size)
+
+
+def _live_rows(poll_id, chunk_size):
+    conn = _connect(poll_id)
+    try:
+        cursor = conn.execute('SELECT a.user_poll_id, s.user_id, a.question_id, a.answer, a.answer_id '
+                              'FROM answers a JOIN submissions s ON s.id = a.user_poll_id '
+                              'WHERE a.isdelete = 0 ORDER BY a.user_poll_id, a.id')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            live = set()
+            for ids_chunk in chunked({row[0] for row in rows}):
+                live.update(UserPollAnswer.objects.filter(id__in=ids_chunk, archived=True)
+                            .values_list('id', flat=True))
+            yield from (row for row in rows if row[0] in live)
+    finally:
+        conn.close()
+
+
+def archived_tally(poll_ids=None):
+    """
+    Recount of live archived answers, same keys as tallies.submissions_tally without poll rows
+    """
+    submissions = UserPollAnswer.objects.filter(archived=True, poll__isnull=False)
+    if poll_ids is not None:
+        submissions = submissions.filter(poll_id__in=poll_ids)
+    counter = Counter()
+    for poll_id in submissions.order_by().values_list('poll_id', flat=True).distinct():
+        submission, answered = None, set()
+        for user_poll_id, _, question_id, _, answer_id in archived_answer_rows(poll_id):
+            if question_id is None:
+                continue
+            if user_poll_id != submission:
+                submission, answered = user_poll_id, set()
+            if question_id not in answered:
+                counter[(poll_id, question_id, None)] += 1
+                answered.add(question_id)
+            if answer_id is not None:
+                counter[(poll_id, question_id, answer_id)] += 1
+    return counter
@@ -0,0 +1,62 @@
+import threading
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import AnswerType
+
+
+class AnswerTypeRegistry:
+    """
+    Process-wide registry of AnswerType rows.
+
+    Rows are loaded on first use and reloaded after AnswerType changes in this process,
+    so type resolution in validation makes no queries. A miss reloads the rows once,
+    picking up types added by other processes or without signals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = None
+
+    def _load(self):
+        types = self._types
+        if types is None:
+            with self._lock:
+                if self._types is None:
+                    rows = list(AnswerType.all_objects.order_by('-id'))
+                    self._types = {t.type: t for t in rows}, {t.id: t.type for t in rows}
+                types = self._types
+        return types
+
+    def _lookup(self, index, key):
+        types = self._load()
+        if key not in types[index]:
+            with self._lock:
+                # concurrent misses on the same rows reload them once
+                if self._types is types:
+                    self._types = None
+            types = self._load()
+        return types[index].get(key)
+
+    def get(self, name):
+        return self._lookup(0, name)
+
+    def id_of(self, name):
+        answer_type = self.get(name)
+        return answer_type.id if answer_type else None
+
+    def ids_of(self, *names):
+        return {self.id_of(n) for n in names} - {None}
+
+    def name_of(self, answer_type_id):
+        return self._lookup(1, answer_type_id)
+
+    def reset(self):
+        self._types = None
+
+
+answer_types = AnswerTypeRegistry()
+
+
+@receiver([post_save, post_delete], sender=AnswerType)
+def reset_answer_types(**kwargs):
+    answer_types.reset()
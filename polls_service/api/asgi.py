@@ -0,0 +1,52 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import django
+from django.core.handlers import asgi
+from django.db import connections
+
+_DONE = object()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    ASGIHandler iterating streaming responses in a thread of their own.
+
+    Django 3.0 iterates them on the event loop, where the ORM raises SynchronousOnlyOperation
+    and a slow iterator blocks every request of the worker. A streaming response is read by a
+    single thread from its first to its last part, so cursors and SQLite connections opened
+    by the iterator stay in the thread which opened them; its database connections are closed
+    with the response.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super(ASGIHandler, self).send_response(response, send)
+        headers = [(str(header).encode('ascii'), str(value).encode('latin1')) for header, value in response.items()]
+        headers.extend((b'Set-Cookie', c.output(header='').encode('ascii').strip()) for c in response.cookies.values())
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        parts = iter(response)
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, _DONE)
+                if part is _DONE:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await loop.run_in_executor(executor, _close, response)
+            executor.shutdown(wait=False)
+
+
+def _close(response):
+    try:
+        response.close()
+    finally:
+        connections.close_all()
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return ASGIHandler()
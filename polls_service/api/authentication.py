@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken
+
+
+class TokenCache:
+    """
+    Process-wide LRU of validated access tokens: token -> (memoized until, user, access token).
+
+    Entries are dropped when the token expires, after OAUTH2_TOKEN_CACHE_TIMEOUT seconds
+    and at once when the token or its user is saved or deleted in this process.
+    Other processes see a revoke after at most OAUTH2_TOKEN_CACHE_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            until, user, access_token = entry
+            if until < time.monotonic() or access_token.is_expired():
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return user, access_token
+
+    def put(self, token, user, access_token):
+        with self._lock:
+            self._tokens[token] = time.monotonic() + settings.OAUTH2_TOKEN_CACHE_TIMEOUT, user, access_token
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > settings.OAUTH2_TOKEN_CACHE_SIZE:
+                self._tokens.popitem(last=False)
+
+    def evict(self, token):
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for token in [t for t, (_, user, _) in self._tokens.items() if user.id == user_id]:
+                del self._tokens[token]
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+token_cache = TokenCache()
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def evict_access_token(instance, **kwargs):
+    token_cache.evict(instance.token)
+
+
+@receiver([post_save, post_delete], sender=User)
+def evict_user_tokens(instance, **kwargs):
+    token_cache.evict_user(instance.id)
+
+
+def bearer_token(request):
+    header = request.META.get('HTTP_AUTHORIZATION') or request.META.get('Authorization') or ''
+    scheme, _, token = header.partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    OAuth2Authentication memoizing validated bearer tokens in token_cache,
+    requests with a warm token make no queries to authenticate
+    """
+
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if not token:
+            return super(CachedOAuth2Authentication, self).authenticate(request)
+        cached = token_cache.get(token)
+        if cached:
+            return cached
+        result = super(CachedOAuth2Authentication, self).authenticate(request)
+        if result:
+            token_cache.put(token, *result)
+        return result
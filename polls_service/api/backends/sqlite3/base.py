@@ -0,0 +1,25 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend executing OPTIONS['pragmas'] (PRAGMA name -> value) on every new connection.
+
+    Transactions start with BEGIN IMMEDIATE: a deferred transaction that reads before writing
+    fails at once with "database is locked" when another writer commits first, an immediate
+    one waits for the write lock up to the busy timeout.
+    """
+
+    def get_connection_params(self):
+        kwargs = super(DatabaseWrapper, self).get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,604 @@
+import datetime
+import itertools
+import json
+import resource
+import statistics
+import time
+import tracemalloc
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Prefetch
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from .asgi import get_asgi_application
+from .authentication import CachedOAuth2Authentication, token_cache
+from .export import EXPORT_FORMATS
+from .loadtest import run_asgi, run_wsgi, wsgi_request
+from .metrics import REQUEST_RENDER, MetricsMiddleware
+from .models import Poll, Question, AnswerType, AnswerOptions, UserPollAnswer, UserPollQuestionAnswer
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import PollSerializer, PollValuesSerializer, QuestionSerializer, QuestionValuesSerializer, \
+    UserPollAnswerSerializer, UserPollAnswerValuesSerializer
+from .submissions import save_submissions
+from .views import PollViewSet, QuestionViewSet
+
+
+def seed_poll(questions=10, options=4):
+    """
+    Create a poll with a mix of text, choise and choise_multi questions
+    """
+    today = datetime.date.today()
+    types = {t.type: t for t in AnswerType.objects.all()}
+    type_names = ['text', 'choise', 'choise_multi']
+    poll = Poll.objects.create(name='bench poll',
+                               start_date=today - datetime.timedelta(days=1),
+                               end_date=today + datetime.timedelta(days=1),
+                               description='bench')
+    opts = [AnswerOptions.objects.create(text=f'bench option {i}') for i in range(options)]
+    for i in range(questions):
+        q = Question.objects.create(text=f'bench question {i}', answer_type=types[type_names[i % 3]])
+        if q.answer_type.type != 'text':
+            q.answer.add(*opts)
+        poll.question.add(q)
+    return poll
+
+
+def seed_polls(count, active=1000):
+    """
+    Bulk create polls, the newest ones are active, older ones ended or are deleted
+    """
+    today = datetime.date.today()
+    batch = []
+    for i in range(count):
+        is_active = i >= count - active
+        batch.append(Poll(name=f'poll {i}', start_date=today - datetime.timedelta(days=30),
+                          end_date=today + datetime.timedelta(days=1 if is_active else -(i % 30)),
+                          isdelete=not is_active and i % 10 == 1))
+        if len(batch) == 10000:
+            Poll.objects.bulk_create(batch)
+            batch = []
+    Poll.objects.bulk_create(batch)
+
+
+def time_sql(sql, params, repeat):
+    timings = []
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def make_submission(poll, user_id):
+    answers = []
+    for q in poll.question.select_related('answer_type').prefetch_related('answer').order_by('id'):
+        options = [a.id for a in q.answer.all()]
+        if q.answer_type.type == 'text':
+            answers.append({'question': q.id, 'answer': f'answer of user {user_id}'})
+        elif q.answer_type.type == 'choise':
+            answers.append({'question': q.id, 'answer_id': options[user_id % len(options)]})
+        else:
+            answers.extend({'question': q.id, 'answer_id': a} for a in options[:2])
+    return {'user_id': user_id, 'poll': poll.id, 'answers': answers}
+
+
+def bench_submit(options, stdout):
+    """
+    Submissions per second through the single POST and the batch endpoint
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    submission = make_submission(poll, 0)
+    payloads = [dict(submission, user_id=u) for u in range(options['submissions'])]
+    client = APIClient()
+
+    start = time.perf_counter()
+    for p in payloads:
+        client.post(reverse('answer-list'), data=p, format='json')
+    single = len(payloads) / (time.perf_counter() - start)
+
+    # a user answers a poll once, the batch run submits for other users
+    payloads = [dict(submission, user_id=len(payloads) + u) for u in range(len(payloads))]
+    batch_size = options['batch_size']
+    start = time.perf_counter()
+    for i in range(0, len(payloads), batch_size):
+        client.post(reverse('answer-batch'), data=payloads[i:i + batch_size], format='json')
+    batch = len(payloads) / (time.perf_counter() - start)
+
+    stdout.write(f'submit: single POST {single:.1f} submissions/s, batch {batch:.1f} submissions/s '
+                 f'(x{batch / single:.1f})')
+    return {'single_per_sec': single, 'batch_per_sec': batch}
+
+
+def bench_active_polls(options, stdout):
+    """
+    Database time of the active poll list page and its count query
+    """
+    seed_polls(options['polls'], options['active_polls'])
+    queryset = PollViewSet().get_queryset()
+    stdout.write(f"active_polls: {queryset.count()} active of {options['polls']} polls")
+    page = queryset[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+    stdout.write(page.explain())
+    page_sql, params = page.query.sql_with_params()
+    count_sql, _ = queryset.order_by().values('id').query.sql_with_params()
+    result = {}
+    for name, sql in (('page', page_sql), ('count', f'SELECT COUNT(*) FROM ({count_sql}) subquery')):
+        timings = time_sql(sql, params, options['repeat'])
+        result[name] = {'median_ms': statistics.median(timings), 'max_ms': max(timings)}
+        stdout.write(f"active_polls {name}: median {result[name]['median_ms']:.3f} ms, "
+                     f"max {result[name]['max_ms']:.3f} ms")
+    return result
+
+
+def seed_history(user_id, count):
+    batch = []
+    for i in range(count):
+        batch.append(UserPollAnswer(user_id=user_id))
+        if len(batch) == 10000:
+            UserPollAnswer.objects.bulk_create(batch)
+            batch = []
+    UserPollAnswer.objects.bulk_create(batch)
+
+
+def time_get(client, url, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.get(url, params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def bench_deep_page(options, stdout):
+    """
+    Latency of a deep answer history page with page number and keyset pagination
+    """
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page = options['page']
+    seed_history(1, page * page_size)
+    url = reverse('answer-list')
+    paginator = KeysetPagination()
+    paginator.base_url = url
+    first_id = UserPollAnswer.objects.filter(user_id=1).order_by('id') \
+        .values_list('id', flat=True)[(page - 1) * page_size - 1]
+    cursor = parse_qs(urlparse(paginator.encode_cursor(Cursor(offset=0, reverse=False, position=first_id))).query)
+    client = APIClient()
+    result = {}
+    for name, params in (('page_number', {'user_id': 1, 'page': page}),
+                         ('keyset', {'user_id': 1, 'cursor': cursor['cursor'][0]})):
+        timings = time_get(client, url, params, options['repeat'])
+        result[name] = {'median_ms': statistics.median(timings), 'max_ms': max(timings)}
+        stdout.write(f"deep_page {name} page {page}: median {result[name]['median_ms']:.3f} ms, "
+                     f"max {result[name]['max_ms']:.3f} ms")
+    return result
+
+
+def seed_answers(poll, count):
+    """
+    Bulk create count submissions to the poll with explicit ids
+    """
+    submission = make_submission(poll, 0)
+    next_id = (UserPollAnswer.all_objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    parents, answers = [], []
+    for i in range(count):
+        parents.append(UserPollAnswer(id=next_id + i, user_id=i, poll=poll))
+        answers.extend(UserPollQuestionAnswer(user_poll_id=next_id + i, question_id=a['question'],
+                                              answer=a.get('answer', ''), answer_id_id=a.get('answer_id'))
+                       for a in submission['answers'])
+        if len(parents) == 1000 or i == count - 1:
+            UserPollAnswer.objects.bulk_create(parents)
+            UserPollQuestionAnswer.objects.bulk_create(answers)
+            parents, answers = [], []
+
+
+def bench_export(options, stdout):
+    """
+    Time to first byte, duration and peak memory of streaming poll answers export
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    seed_answers(poll, options['submissions'])
+    client = APIClient()
+    client.force_authenticate(User.objects.create(username='bench'))
+    url = reverse('poll-export', args=(poll.id,))
+    result = {}
+    for export_format in EXPORT_FORMATS:
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(url, {'export_format': export_format})
+        size = 0
+        ttfb = None
+        for chunk in response.streaming_content:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            size += len(chunk)
+        duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[export_format] = {'ttfb_ms': ttfb * 1000, 'duration_s': duration, 'bytes': size,
+                                 'peak_traced_mb': peak / 2 ** 20,
+                                 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        stdout.write(f"export {export_format}: {size / 2 ** 20:.1f} MB in {duration:.2f} s, "
+                     f"first byte {ttfb * 1000:.1f} ms, peak traced memory {peak / 2 ** 20:.1f} MB, "
+                     f"max RSS {result[export_format]['max_rss_mb']:.0f} MB")
+    return result
+
+
+def bench_serving(options, stdout):
+    """
+    Requests per second and p99 latency of hot endpoints served in-process
+    by the WSGI application (runserver baseline) and the ASGI application
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    seed_answers(poll, 100)
+    submission = make_submission(poll, 0)
+    next_user = itertools.count(100)
+    endpoints = [('GET', reverse('poll-list'), b''),
+                 ('GET', reverse('poll-question-list', args=(poll.id,)), b''),
+                 ('GET', reverse('poll-results', args=(poll.id,)), b''),
+                 ('POST', reverse('answer-list'), None)]
+    result = {}
+    for name, run, app in (('wsgi', run_wsgi, get_wsgi_application()), ('asgi', run_asgi, get_asgi_application())):
+        # every POST answers for a new user, repeated submissions are rejected
+        requests = [(method, url, body if body is not None else
+                     json.dumps(dict(submission, user_id=next(next_user))).encode())
+                    for method, url, body in (endpoints[i % len(endpoints)] for i in range(options['requests']))]
+        result[name] = run(app, requests, options['concurrency'])
+        stdout.write(f"serving {name}: {result[name]['rps']:.1f} requests/s, p50 {result[name]['p50_ms']:.1f} ms, "
+                     f"p99 {result[name]['p99_ms']:.1f} ms, {result[name]['errors']} errors")
+    return result
+
+
+def bench_concurrency(options, stdout):
+    """
+    Answer submissions per second posted from concurrency threads under each database profile.
+    SQLite runs the stock backend with default journaling and a connection per request, then
+    the sqlite-wal profile; other databases run once with their own settings.
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    submission = make_submission(poll, 0)
+    next_user = itertools.count()
+    database = connections.databases['default']
+    if connection.vendor == 'sqlite':
+        wal = settings.DATABASE_PROFILES['sqlite-wal']
+        # WAL mode persists in the database file, the default journal runs first
+        profiles = [('sqlite', {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0, 'OPTIONS': {}}),
+                    ('sqlite-wal', {'ENGINE': wal['ENGINE'], 'CONN_MAX_AGE': wal['CONN_MAX_AGE'],
+                                    'OPTIONS': wal['OPTIONS']})]
+    else:
+        profiles = [(connection.vendor, {})]
+    app = get_wsgi_application()
+    original = {key: database[key] for key in ('ENGINE', 'CONN_MAX_AGE', 'OPTIONS')}
+    result = {}
+    for name, profile in profiles + [(None, original)]:
+        connections.close_all()
+        database.update(profile)
+        connections[DEFAULT_DB_ALIAS] = load_backend(database['ENGINE']).DatabaseWrapper(database, DEFAULT_DB_ALIAS)
+        if name:
+            # every profile answers for new users, repeated submissions are rejected
+            requests = [('POST', reverse('answer-list'), json.dumps(dict(submission, user_id=next(next_user))).encode())
+                        for _ in range(options['submissions'])]
+            result[name] = run_wsgi(app, requests, options['concurrency'])
+            stdout.write(f"concurrency {name}: {result[name]['rps']:.1f} submissions/s from "
+                         f"{options['concurrency']} threads, p99 {result[name]['p99_ms']:.1f} ms, "
+                         f"{result[name]['errors']} errors")
+    return result
+
+
+def bench_auth(options, stdout):
+    """
+    Queries and latency of authenticated admin reads served from the polls cache
+    with the stock OAuth2 authentication and with warm cached tokens
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    user = User.objects.create(username='bench-admin')
+    application = Application.objects.create(name='bench', user=user, client_type=Application.CLIENT_CONFIDENTIAL,
+                                             authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS)
+    token = AccessToken.objects.create(user=user, application=application, token='bench-token', scope='read write',
+                                       expires=timezone.now() + datetime.timedelta(hours=1))
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+    urls = [reverse('poll-list'), reverse('poll-question-list', args=(poll.id,))]
+    result = {}
+    for name, authentication in (('oauth2', OAuth2Authentication), ('cached', CachedOAuth2Authentication)):
+        token_cache.clear()
+        with mock.patch.object(PollViewSet, 'authentication_classes', [authentication]), \
+                mock.patch.object(QuestionViewSet, 'authentication_classes', [authentication]):
+            for url in urls:
+                client.get(url)
+            with CaptureQueriesContext(connection) as ctx:
+                timings = [t for url in urls for t in time_get(client, url, {}, options['repeat'])]
+        result[name] = {'queries_per_request': len(ctx) / len(timings), 'median_ms': statistics.median(timings)}
+        stdout.write(f"auth {name}: {result[name]['queries_per_request']:.1f} queries/request, "
+                     f"median {result[name]['median_ms']:.3f} ms")
+    return result
+
+
+def bench_metrics(options, stdout):
+    """
+    Overhead of MetricsMiddleware on a mix of cached reads, an answer history page and
+    an answer submission: sum of median latencies with requests to the two handlers interleaved
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    seed_answers(poll, 100)
+    submission = make_submission(poll, 0)
+    next_user = itertools.count(100)
+    requests = [('GET', reverse('poll-list'), b''),
+                ('GET', reverse('poll-question-list', args=(poll.id,)), b''),
+                ('GET', f"{reverse('answer-list')}?user_id=1", b''),
+                ('POST', reverse('answer-list'), None)]
+    with override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != 'api.metrics.MetricsMiddleware']):
+        plain = WSGIHandler()
+    handlers = {'plain': plain, 'metrics': WSGIHandler()}
+    timings = {name: [[] for _ in requests] for name in handlers}
+    for i in range(options['repeat']):
+        for j, request in enumerate(requests):
+            for name, handler in sorted(handlers.items(), reverse=i % 2):
+                method, url, body = request
+                if body is None:
+                    body = json.dumps(dict(submission, user_id=next(next_user))).encode()
+                start = time.perf_counter()
+                wsgi_request(handler, method, url, body)
+                timings[name][j].append(time.perf_counter() - start)
+    # medians: commits of answer submissions have fsync outliers far larger than the overhead
+    result = {name: sum(statistics.median(t) for t in per_request) * 1000 for name, per_request in timings.items()}
+    result['overhead_pct'] = (result['metrics'] / result['plain'] - 1) * 100
+    # the difference above is within the noise of the submissions, time the middleware on its own as well
+    request = RequestFactory().get(requests[0][1])
+    request.resolver_match = None
+    response = HttpResponse()
+
+    def view(request):
+        return response
+
+    calls = 10000
+    own = {}
+    for name, call in (('view', view), ('middleware', MetricsMiddleware(view))):
+        start = time.perf_counter()
+        for _ in range(calls):
+            call(request)
+        own[name] = (time.perf_counter() - start) / calls * 1e6
+    result['middleware_us'] = own['middleware'] - own['view']
+    cheapest = min(statistics.median(t) for t in timings['plain']) * 1e6
+    result['cheapest_overhead_pct'] = result['middleware_us'] / cheapest * 100
+    render = REQUEST_RENDER.samples((('view', 'poll-question-list'), ('method', 'GET')))
+    stdout.write(f"metrics: {result['plain']:.3f} ms without middleware, {result['metrics']:.3f} ms with it "
+                 f"({result['overhead_pct']:+.2f}%), question list render {render[2] / render[1] * 1000:.3f} ms\n"
+                 f"metrics: middleware {result['middleware_us']:.1f} us per request, "
+                 f"{result['cheapest_overhead_pct']:.2f}% of the cheapest request ({cheapest:.0f} us)")
+    return result
+
+
+def seed_dataset(polls, questions, options, users, answers_per_user):
+    """
+    Create polls with questions and options, and answers_per_user submissions of every user
+    spread over the polls. A user answers a poll once, answers_per_user is capped at polls.
+    """
+    answers_per_user = min(answers_per_user, polls)
+    seeded = [seed_poll(questions, options) for _ in range(polls)]
+    templates = {}
+    for poll in seeded:
+        templates[poll.id] = [{'question_id': a['question'], 'answer': a.get('answer', ''),
+                               'answer_id_id': a.get('answer_id')} for a in make_submission(poll, 0)['answers']]
+    save_submissions([{'user_id': user_id, 'poll': poll, 'answers': templates[poll.id]}
+                      for user_id in range(users)
+                      for poll in (seeded[(user_id + i) % polls] for i in range(answers_per_user))])
+    return seeded
+
+
+def time_calls(calls):
+    """
+    Run the calls one after another, return latency percentiles, throughput and queries per call
+    """
+    timings = []
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - call_start) * 1000)
+        duration = time.perf_counter() - start
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'queries_per_call': len(ctx) / len(timings),
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'rps': len(timings) / duration,
+    }
+
+
+def bench_hot_paths(options, stdout):
+    """
+    Latency percentiles, throughput and queries per call of the API hot paths on seeded data:
+    poll list, question tree, answer submission, answer history and poll results, each warmed up
+    with a call per poll
+    """
+    polls = seed_dataset(options['seed_polls'], options['questions'], options['options'],
+                         options['users'], options['answers_per_user'])
+    payloads = {poll.id: make_submission(poll, 0) for poll in polls}
+    client = APIClient()
+    repeat = options['repeat']
+    next_user = iter(range(options['users'], options['users'] + repeat + len(polls)))
+
+    def submit(poll):
+        client.post(reverse('answer-list'), data=dict(payloads[poll.id], user_id=next(next_user)), format='json')
+
+    paths = {
+        'poll_list': lambda i: client.get(reverse('poll-list')),
+        'question_tree': lambda i: client.get(reverse('poll-question-list', args=(polls[i % len(polls)].id,))),
+        'submit': lambda i: submit(polls[i % len(polls)]),
+        'history': lambda i: client.get(reverse('answer-list'), {'user_id': i % options['users']}),
+        'results': lambda i: client.get(reverse('poll-results', args=(polls[i % len(polls)].id,))),
+    }
+    result = {}
+    for name, path in paths.items():
+        # one call per poll first so cached paths are measured warm whatever the repeat count
+        for i in range(len(polls)):
+            path(i)
+        result[name] = time_calls([lambda i=i: path(i) for i in range(repeat)])
+        stdout.write(f"hot_paths {name}: {result[name]['queries_per_call']:.1f} queries/call, "
+                     f"p50 {result[name]['p50_ms']:.3f} ms, p95 {result[name]['p95_ms']:.3f} ms, "
+                     f"p99 {result[name]['p99_ms']:.3f} ms, {result[name]['rps']:.1f} calls/s")
+    return result
+
+
+def bench_snapshot(options, stdout):
+    """
+    Loading a whole poll: poll GET plus question pages against the gzip encoded snapshot
+    """
+    poll = seed_poll(options['questions'], options['options'])
+    client = APIClient()
+    questions_url = reverse('poll-question-list', args=(poll.id,))
+
+    def pages():
+        client.get(reverse('poll-detail', args=(poll.id,)))
+        url = questions_url
+        while url:
+            url = client.get(url).data['next']
+
+    def snapshot():
+        return client.get(reverse('poll-snapshot', args=(poll.id,)), HTTP_ACCEPT_ENCODING='gzip')
+
+    pages()
+    size = {'identity': len(client.get(reverse('poll-snapshot', args=(poll.id,))).content),
+            'gzip': len(snapshot().content)}
+    result = {'pages': time_calls([pages] * options['repeat']), 'snapshot': time_calls([snapshot] * options['repeat'])}
+    for name, r in result.items():
+        stdout.write(f"snapshot {name}: {r['queries_per_call']:.1f} queries/call, p50 {r['p50_ms']:.3f} ms, "
+                     f"p99 {r['p99_ms']:.3f} ms")
+    stdout.write(f"snapshot size: {size['identity']} bytes, {size['gzip']} gzip")
+    result['bytes'] = size
+    return result
+
+
+def seed_page_rows(rows, options):
+    """
+    A page worth of rows for every read path: active polls, questions of one poll and
+    submissions of user 1 with two answers each. Return the poll.
+    """
+    seed_polls(rows, active=rows)
+    poll = seed_poll(0)
+    types = list(AnswerType.objects.order_by('id'))
+    AnswerOptions.objects.bulk_create([AnswerOptions(text=f'page option {i}') for i in range(options)])
+    opts = list(AnswerOptions.objects.filter(text__startswith='page option').order_by('id'))
+    questions = [Question(text=f'page question {i}', answer_type=types[i % 3]) for i in range(rows)]
+    Question.objects.bulk_create(questions)
+    questions = list(Question.objects.filter(text__startswith='page question').order_by('id'))
+    Poll.question.through.objects.bulk_create([Poll.question.through(poll_id=poll.id, question_id=q.id)
+                                               for q in questions])
+    Question.answer.through.objects.bulk_create([Question.answer.through(question_id=q.id, answeroptions_id=o.id)
+                                                 for q in questions if q.answer_type_id != types[0].id
+                                                 for o in opts])
+    seed_history(1, rows)
+    answers = []
+    for user_poll_id in UserPollAnswer.objects.filter(user_id=1).values_list('id', flat=True):
+        answers.append(UserPollQuestionAnswer(user_poll_id=user_poll_id, question=questions[0], answer='text'))
+        answers.append(UserPollQuestionAnswer(user_poll_id=user_poll_id, question=questions[1],
+                                              answer_id_id=opts[0].id))
+    UserPollQuestionAnswer.objects.bulk_create(answers)
+    return poll
+
+
+def bench_serialization(options, stdout):
+    """
+    Rows per second of serializing and rendering a page_rows page of the poll list, a question
+    tree and an answer history: model serializers with JSONRenderer against values()
+    serializers with FastJSONRenderer, including the page queries
+    """
+    rows = options['page_rows']
+    poll = seed_page_rows(rows, options['options'])
+    polls = Poll.objects.filter(end_date__gt=datetime.date.today()).order_by('id')
+    questions = Question.objects.filter(poll__id=poll.id).order_by('id')
+    history = UserPollAnswer.objects.filter(user_id=1).order_by('id')
+    paths = {
+        'poll_list': (polls, PollSerializer, PollValuesSerializer),
+        'question_tree': (questions.prefetch_related('answer'), QuestionSerializer, QuestionValuesSerializer),
+        'history': (history.prefetch_related(Prefetch('answers', queryset=UserPollQuestionAnswer.objects
+                                                      .order_by('id'))),
+                    UserPollAnswerSerializer, UserPollAnswerValuesSerializer),
+    }
+    repeat = max(1, options['repeat'] // 20)
+    result = {}
+    for name, (queryset, model_serializer, values_serializer) in paths.items():
+        variants = {
+            'model': lambda: JSONRenderer().render(model_serializer(queryset[:rows], many=True).data),
+            'values': lambda: FastJSONRenderer().render(values_serializer(values_serializer.values(queryset)[:rows],
+                                                                          many=True).data),
+        }
+        output = {}
+        result[name] = {}
+        for variant, render in variants.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output[variant] = render()
+                timings.append(time.perf_counter() - start)
+            result[name][variant] = {'rows_per_sec': rows / statistics.median(timings)}
+        result[name]['speedup'] = result[name]['values']['rows_per_sec'] / result[name]['model']['rows_per_sec']
+        stdout.write(f"serialization {name}: model {result[name]['model']['rows_per_sec']:.0f} rows/s, "
+                     f"values {result[name]['values']['rows_per_sec']:.0f} rows/s (x{result[name]['speedup']:.1f}), "
+                     f"{'same' if output['model'] == output['values'] else 'DIFFERENT'} output")
+    return result
+
+
+# metric name -> direction compared against a baseline, other metrics are only reported
+LOWER_IS_BETTER = {'p50_ms', 'p95_ms', 'median_ms', 'ttfb_ms'}
+HIGHER_IS_BETTER = {'rps', 'single_per_sec', 'batch_per_sec', 'rows_per_sec'}
+QUERY_COUNTS = {'queries_per_call', 'queries_per_request'}
+
+
+def compare_results(baseline, results, tolerance, path=()):
+    """
+    Regressions of results against baseline: any failed request, any increase of a query count,
+    or a timing or throughput worse than the baseline by more than tolerance (a fraction)
+    """
+    regressions = []
+    for key, value in results.items():
+        name = '.'.join(path + (key,))
+        old = baseline.get(key)
+        if isinstance(value, dict):
+            # failed requests are regressions even in results missing from the baseline
+            regressions.extend(compare_results(old if isinstance(old, dict) else {}, value, tolerance, path + (key,)))
+        elif key == 'errors' and value > 0:
+            regressions.append(f'{name}: {value} failed requests')
+        elif old is None:
+            continue
+        elif key in QUERY_COUNTS and value > old:
+            regressions.append(f'{name}: {old:.2f} -> {value:.2f} queries')
+        elif key in LOWER_IS_BETTER and value > old * (1 + tolerance):
+            regressions.append(f'{name}: {old:.3f} -> {value:.3f} ms (+{(value / old - 1) * 100:.0f}%)')
+        elif key in HIGHER_IS_BETTER and value < old * (1 - tolerance):
+            regressions.append(f'{name}: {old:.1f} -> {value:.1f} per second ({(value / old - 1) * 100:.0f}%)')
+    return regressions
+
+
+SCENARIOS = {
+    'hot_paths': bench_hot_paths,
+    'submit': bench_submit,
+    'active_polls': bench_active_polls,
+    'deep_page': bench_deep_page,
+    'export': bench_export,
+    'serving': bench_serving,
+    'concurrency': bench_concurrency,
+    'auth': bench_auth,
+    'metrics': bench_metrics,
+    'serialization': bench_serialization,
+    'snapshot': bench_snapshot,
+}
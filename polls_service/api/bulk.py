@@ -0,0 +1,22 @@
+from django.db import connection
+
+SQL_VARIABLES_CHUNK = 500
+
+
+def chunked(items, size=SQL_VARIABLES_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_create_with_ids(model, objs):
+    """
+    Insert objs so that their primary keys are set afterwards.
+    A single bulk insert when the backend returns primary keys from bulk inserts,
+    otherwise objects are saved one by one.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .models import Poll
+
+CATALOGUE = 'catalogue'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def polls_cache():
+    return caches[settings.POLLS_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f'polls:{scope}:version'
+
+
+def _version(cache, scope):
+    """
+    Current version token of a cache scope, a fresh token is created when the scope was evicted
+    """
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def poll_scope(poll_id):
+    return f'poll:{poll_id}'
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cached(scope, key, build):
+    """
+    Read-through lookup of key inside a versioned scope
+    """
+    cache = polls_cache()
+    digest = hashlib.md5(key.encode()).hexdigest()
+    cache_key = f'polls:{scope}:{_version(cache, scope)}:{digest}'
+    value = cache.get(cache_key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = build()
+    cache.set(cache_key, value, settings.POLLS_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate(*scopes):
+    """
+    Bump versions of the scopes, entries of the previous versions expire on their own
+    """
+    polls_cache().set_many({_version_key(s): uuid.uuid4().hex for s in scopes}, None)
+
+
+def invalidate_polls(poll_ids, catalogue=False):
+    """
+    Touch modified of the polls, the revision of their conditional GETs, and bump their cache scopes
+    """
+    poll_ids = list(poll_ids)
+    if poll_ids:
+        Poll.all_objects.filter(id__in=poll_ids).update(modified=timezone.now())
+    scopes = [poll_scope(p) for p in poll_ids]
+    if catalogue:
+        scopes.append(CATALOGUE)
+    if scopes:
+        invalidate(*scopes)
+
+
+def invalidate_question(question):
+    invalidate_polls(question.poll_set.values_list('id', flat=True))
+
+
+def stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return {'backend': settings.CACHES[settings.POLLS_CACHE_ALIAS]['BACKEND'], 'hits': hits, 'misses': misses}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,73 @@
+import csv
+import itertools
+import json
+from .answer_archive import archived_answer_rows
+from .models import UserPollAnswer, UserPollQuestionAnswer
+
+EXPORT_COLUMNS = ['user_poll', 'user_id', 'question', 'answer', 'answer_id']
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def poll_answer_rows(poll_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Live answers of the poll as tuples of EXPORT_COLUMNS read with a server-side iterator.
+    Row order is unspecified: ORDER BY would sort the whole poll before the first row is sent,
+    consumers needing an order sort the export themselves. Archived answers follow the hot ones.
+    """
+    hot = UserPollQuestionAnswer.objects \
+        .filter(user_poll__isdelete=False, user_poll__poll_id=poll_id) \
+        .order_by() \
+        .values_list('user_poll_id', 'user_poll__user_id', 'question_id', 'answer', 'answer_id_id') \
+        .iterator(chunk_size=chunk_size)
+    archived = UserPollAnswer.all_objects.filter(poll_id=poll_id, archived=True).exists()
+    return itertools.chain(hot, archived_answer_rows(poll_id, chunk_size) if archived else ())
+
+
+class _Line:
+    """
+    File-like object for csv.writer returning written line instead of storing it
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def buffered(lines, size=EXPORT_BUFFER_SIZE):
+    """
+    Join lines into chunks of about size characters
+    """
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_poll_answers(poll_id, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    lines, _ = EXPORT_FORMATS[export_format]
+    return buffered(lines(poll_answer_rows(poll_id, chunk_size)))
@@ -0,0 +1,141 @@
+import datetime
+import random
+from collections import Counter
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from .answer_types import answer_types
+from .importer import resolve_answer_options
+from .models import Poll, Question, UserPollAnswer, UserPollQuestionAnswer
+from .tallies import add_to_tallies
+
+GENERATE_CHUNK_SIZE = 50000
+
+
+def next_id(model):
+    return (model.all_objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+
+def reset_sequences(models):
+    """
+    Move primary key sequences past explicitly inserted ids as loaddata does, a no-op on SQLite
+    """
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def insert_rows(table, columns, rows):
+    """
+    Raw executemany insert, skips model instances for the bulk of generated rows
+    """
+    quote = connection.ops.quote_name
+    sql = f"INSERT INTO {quote(table)} ({', '.join(quote(c) for c in columns)}) " \
+          f"VALUES ({', '.join(['%s'] * len(columns))})"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+SUBMISSION_COLUMNS = ['id', 'user_id', 'poll_id', 'isdelete', 'archived']
+ANSWER_COLUMNS = ['user_poll_id', 'question_id', 'answer', 'answer_id_id', 'isdelete']
+
+
+class _Writer:
+    """
+    Buffers generated submission and answer rows, writes them in chunked transactions
+    """
+
+    def __init__(self, chunk_size, progress):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.submissions = []
+        self.answers = []
+        self.written = Counter()
+
+    def add(self, submission, answers):
+        self.submissions.append(submission)
+        self.answers.extend(answers)
+        if len(self.answers) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            insert_rows(UserPollAnswer._meta.db_table, SUBMISSION_COLUMNS, self.submissions)
+            insert_rows(UserPollQuestionAnswer._meta.db_table, ANSWER_COLUMNS, self.answers)
+        self.written['submissions'] += len(self.submissions)
+        self.written['answers'] += len(self.answers)
+        self.submissions, self.answers = [], []
+        self.progress(self.written)
+
+
+def generate(polls, questions=(5, 30), options=(2, 6), users=(100, 1000), text_share=0.3, multi_share=0.3,
+             active_share=0.5, seed=0, chunk_size=GENERATE_CHUNK_SIZE, progress=lambda written: None):
+    """
+    Bulk create polls with their questions, options and answers. Poll sizes, options per choise
+    question and users per poll are uniform in the given (min, max) ranges; text_share and
+    multi_share are the fractions of text and choise_multi questions, the rest are choise.
+    Rows get explicit ids after the current maximum, so nothing else may write meanwhile,
+    primary key sequences are reset afterwards.
+    Poll result tallies are created for the generated answers.
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    type_ids = {name: answer_types.id_of(name) for name in ('text', 'choise', 'choise_multi')}
+    pool = list(resolve_answer_options([f'option {i}' for i in range(1, options[1] + 1)]).values())
+
+    poll_id, question_id = next_id(Poll), next_id(Question)
+    poll_rows, question_rows, poll_questions, question_options = [], [], [], []
+    trees = []
+    for i in range(polls):
+        active = rng.random() < active_share
+        poll_rows.append(Poll(id=poll_id, name=f'generated poll {poll_id}', description='generated',
+                              start_date=today - datetime.timedelta(days=rng.randint(1, 60)),
+                              end_date=today + datetime.timedelta(days=rng.randint(1, 30) if active
+                                                                  else -rng.randint(0, 30))))
+        tree = []
+        for _ in range(rng.randint(*questions)):
+            roll = rng.random()
+            kind = 'text' if roll < text_share else 'choise_multi' if roll < text_share + multi_share else 'choise'
+            question_rows.append(Question(id=question_id, text=f'generated question {question_id}',
+                                          answer_type_id=type_ids[kind]))
+            poll_questions.append((poll_id, question_id))
+            choices = [] if kind == 'text' else rng.sample(pool, rng.randint(*options))
+            question_options.extend((question_id, option_id) for option_id in choices)
+            tree.append((question_id, kind, choices))
+            question_id += 1
+        trees.append((poll_id, tree))
+        poll_id += 1
+
+    with transaction.atomic():
+        for start in range(0, len(poll_rows), chunk_size):
+            Poll.objects.bulk_create(poll_rows[start:start + chunk_size])
+        for start in range(0, len(question_rows), chunk_size):
+            Question.objects.bulk_create(question_rows[start:start + chunk_size])
+        insert_rows(Poll.question.through._meta.db_table, ['poll_id', 'question_id'], poll_questions)
+        insert_rows(Question.answer.through._meta.db_table, ['question_id', 'answeroptions_id'], question_options)
+
+    writer = _Writer(chunk_size, progress)
+    tally = Counter()
+    submission_id = next_id(UserPollAnswer)
+    for poll_id, tree in trees:
+        respondents = rng.randint(*users)
+        tally[(poll_id, None, None)] += respondents
+        for user_id in range(1, respondents + 1):
+            answers = []
+            for question_id, kind, choices in tree:
+                if kind == 'text':
+                    answers.append((submission_id, question_id, f'answer {rng.randrange(1000)}', None, False))
+                    picked = ()
+                elif kind == 'choise':
+                    picked = (rng.choice(choices),)
+                else:
+                    picked = rng.sample(choices, rng.randint(1, len(choices)))
+                for option_id in picked:
+                    answers.append((submission_id, question_id, '', option_id, False))
+                    tally[(poll_id, question_id, option_id)] += 1
+                tally[(poll_id, question_id, None)] += 1
+            writer.add((submission_id, user_id, poll_id, False, False), answers)
+            submission_id += 1
+    writer.flush()
+    reset_sequences([Poll, Question, UserPollAnswer])
+    add_to_tallies(tally)
+    return Counter(polls=len(poll_rows), questions=len(question_rows), **writer.written)
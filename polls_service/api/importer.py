@@ -0,0 +1,49 @@
+from django.db import connection, transaction
+from .bulk import bulk_create_with_ids, chunked
+from .models import Poll, Question, AnswerOptions
+
+
+def resolve_answer_options(texts):
+    """
+    Map answer option texts to AnswerOptions ids with IN lookups, missing options are bulk created
+    """
+    texts = set(texts)
+    ids = {}
+    for texts_chunk in chunked(texts):
+        for pk, text in AnswerOptions.objects.filter(text__in=texts_chunk).order_by('-id').values_list('id', 'text'):
+            ids[text] = pk
+    missing = [AnswerOptions(text=t) for t in texts if t not in ids]
+    if missing:
+        AnswerOptions.objects.bulk_create(missing)
+        if connection.features.can_return_rows_from_bulk_insert:
+            ids.update((o.text, o.id) for o in missing)
+        else:
+            for texts_chunk in chunked(o.text for o in missing):
+                ids.update(AnswerOptions.objects.filter(text__in=texts_chunk).values_list('text', 'id'))
+    return ids
+
+
+def import_polls(polls):
+    """
+    Create polls from validated PollImportSerializer data.
+    Answer options are resolved for all polls at once and M2M rows are bulk inserted.
+    """
+    option_ids = resolve_answer_options(a['text'] for p in polls for q in p.get('questions', [])
+                                        for a in q.get('answer', []))
+    QuestionOptions = Question.answer.through
+    PollQuestions = Poll.question.through
+    with transaction.atomic():
+        created = bulk_create_with_ids(Poll, [Poll(**{k: v for k, v in p.items() if k != 'questions'})
+                                              for p in polls])
+        questions = []
+        for poll, p in zip(created, polls):
+            questions.extend((poll, q) for q in p.get('questions', []))
+        question_objs = bulk_create_with_ids(Question, [Question(text=q['text'], answer_type=q['answer_type'])
+                                                        for _, q in questions])
+        QuestionOptions.objects.bulk_create(
+            [QuestionOptions(question_id=obj.id, answeroptions_id=option_id)
+             for obj, (_, q) in zip(question_objs, questions)
+             for option_id in dict.fromkeys(option_ids[a['text']] for a in q.get('answer', []))])
+        PollQuestions.objects.bulk_create([PollQuestions(poll_id=poll.id, question_id=obj.id)
+                                           for obj, (poll, _) in zip(question_objs, questions)])
+    return created
@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError
+from .models import Poll
+from .submissions import save_submissions, without_duplicates
+
+
+class AnswerQueue:
+    """
+    Durable SQLite journal of validated submissions waiting to be bulk inserted.
+
+    Submissions are appended by the API in queue ingestion mode and removed by the
+    drain_answers command after they are stored. Delivery is at-least-once: a drainer
+    stopped between storing a batch and acknowledging it stores the batch again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('CREATE TABLE IF NOT EXISTS submissions '
+                         '(id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, enqueued_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS flushes '
+                         '(id INTEGER PRIMARY KEY CHECK (id = 1), flushed_at REAL NOT NULL, submissions INTEGER NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def put(self, submission):
+        self._connection().execute('INSERT INTO submissions (payload, enqueued_at) VALUES (?, ?)',
+                                   (json.dumps(submission), time.time()))
+
+    def put_many(self, submissions):
+        """
+        Append submissions in one transaction
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT INTO submissions (payload, enqueued_at) VALUES (?, ?)',
+                             [(json.dumps(s), now) for s in submissions])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def take(self, limit):
+        """
+        Oldest queued submissions as (id, submission) pairs
+        """
+        rows = self._connection().execute('SELECT id, payload FROM submissions ORDER BY id LIMIT ?', (limit,))
+        return [(pk, json.loads(payload)) for pk, payload in rows]
+
+    def ack(self, last_id, count):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM submissions WHERE id <= ?', (last_id,))
+            conn.execute('INSERT INTO flushes (id, flushed_at, submissions) VALUES (1, ?, ?) '
+                         'ON CONFLICT (id) DO UPDATE SET flushed_at = excluded.flushed_at, '
+                         'submissions = flushes.submissions + excluded.submissions', (time.time(), count))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def status(self):
+        conn = self._connection()
+        depth, oldest = conn.execute('SELECT COUNT(*), MIN(enqueued_at) FROM submissions').fetchone()
+        flushed = conn.execute('SELECT flushed_at, submissions FROM flushes').fetchone()
+        now = time.time()
+        return {
+            'depth': depth,
+            'flush_lag_s': now - oldest if oldest else 0,
+            'last_flush_s_ago': now - flushed[0] if flushed else None,
+            'flushed_submissions': flushed[1] if flushed else 0,
+        }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def answer_queue():
+    path = settings.ANSWER_QUEUE_PATH
+    with _queues_lock:
+        if path not in _queues:
+            _queues[path] = AnswerQueue(path)
+        return _queues[path]
+
+
+def queued_submission(validated_data):
+    return {'user_id': validated_data['user_id'], 'poll': validated_data['poll'].id,
+            'answers': [dict(a) for a in validated_data['answers']]}
+
+
+def drain(queue, batch_size):
+    """
+    Store up to batch_size oldest queued submissions, return the number of submissions taken.
+    With the 'reject' ANSWER_SUBMISSION_POLICY duplicates of stored submissions are dropped,
+    with 'replace' a submission stored concurrently is replaced.
+    """
+    items = queue.take(batch_size)
+    if not items:
+        return 0
+    polls = Poll.all_objects.in_bulk({s['poll'] for _, s in items})
+    submissions = [dict(s, poll=polls[s['poll']]) for _, s in items if s['poll'] in polls]
+    reject = settings.ANSWER_SUBMISSION_POLICY == 'reject'
+    if reject:
+        submissions, _ = without_duplicates(submissions)
+    try:
+        save_submissions(submissions)
+    except IntegrityError:
+        # a concurrent writer stored a submission of the same user and poll first,
+        # chunks saved before are found again by without_duplicates
+        if reject:
+            submissions, _ = without_duplicates(submissions)
+        save_submissions(submissions)
+    queue.ack(items[-1][0], len(submissions))
+    return len(items)
@@ -0,0 +1,135 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+def _split(url):
+    parts = urlsplit(url)
+    return parts.path, parts.query
+
+
+def wsgi_request(app, method, url, body=b'', content_type='application/json'):
+    """
+    Call a WSGI application in-process, return status code and body
+    """
+    path, query = _split(url)
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    response = app(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+    try:
+        content = b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return status[0], content
+
+
+async def asgi_request(app, method, url, body=b'', content_type='application/json', headers=()):
+    """
+    Call an ASGI application in-process, return status code and body.
+    headers are (name, value) byte string pairs.
+    """
+    path, query = _split(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode())] + list(headers),
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    request_sent = False
+    status = None
+    content = []
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await asyncio.Event().wait()
+        request_sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            content.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(content)
+
+
+def summary(results, duration):
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for _, status in results if status >= 400),
+        'rps': len(latencies) / duration,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def run_wsgi(app, requests, concurrency):
+    """
+    Send (method, url, body) requests from a thread pool, like the threaded runserver
+    """
+    def timed(request):
+        start = time.perf_counter()
+        status, _ = wsgi_request(app, *request)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(timed, requests))
+    return summary(results, time.perf_counter() - start)
+
+
+def run_asgi(app, requests, concurrency):
+    """
+    Send (method, url, body) requests from concurrency coroutines on one event loop
+    """
+    async def worker(queue, results):
+        while queue:
+            request = queue.pop()
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, *request)
+            results.append((time.perf_counter() - start, status))
+
+    async def main():
+        queue = list(reversed(requests))
+        results = []
+        await asyncio.gather(*(worker(queue, results) for _ in range(concurrency)))
+        return results
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    return summary(results, time.perf_counter() - start)
@@ -0,0 +1,31 @@
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.answer_archive import ARCHIVE_CHUNK_SIZE, archivable_polls, archive_path, archive_poll
+
+
+class Command(BaseCommand):
+    help = 'Move answers of polls closed more than --days ago to per poll archive files, resumes interrupted runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ANSWER_ARCHIVE_AFTER_DAYS,
+                            help='Minimum days since the poll end date')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='Submissions archived per transaction')
+        parser.add_argument('--poll', type=int, nargs='+', help='Archive only these polls')
+        parser.add_argument('--dry-run', action='store_true', help='List archivable polls without moving answers')
+
+    def handle(self, *args, **options):
+        polls = archivable_polls(datetime.date.today() - datetime.timedelta(days=options['days']))
+        if options['poll']:
+            polls = polls.filter(id__in=options['poll'])
+        total = 0
+        for poll_id in polls.values_list('id', flat=True):
+            if options['dry_run']:
+                self.stdout.write(f'poll {poll_id}: archivable to {archive_path(poll_id)}')
+                continue
+            archived = archive_poll(poll_id, options['chunk_size'],
+                                    lambda count: self.stdout.write(f'poll {poll_id}: {count} submissions archived'))
+            total += archived
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Archived answers of {total} submissions'))
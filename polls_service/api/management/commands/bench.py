@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from api.benchmarks import SCENARIOS, compare_results
+
+
+# options that change the measured workload, recorded with the results
+BENCH_OPTIONS = ['in_memory', 'seed_polls', 'users', 'answers_per_user', 'questions', 'options', 'submissions',
+                 'batch_size', 'polls', 'active_polls', 'page', 'page_rows', 'requests', 'concurrency', 'repeat']
+
+
+class Command(BaseCommand):
+    help = 'Run API benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run: {', '.join(SCENARIOS)} (default all)")
+        parser.add_argument('--in-memory', action='store_true', help='Use in-memory SQLite database')
+        parser.add_argument('--seed-polls', type=int, default=20, help='Polls seeded for the hot paths')
+        parser.add_argument('--users', type=int, default=200, help='Users seeded for the hot paths')
+        parser.add_argument('--answers-per-user', type=int, default=5,
+                            help='Seeded submissions of every user, at most --seed-polls')
+        parser.add_argument('--questions', type=int, default=40, help='Questions per benchmark poll')
+        parser.add_argument('--options', type=int, default=4, help='Answer options per choise question')
+        parser.add_argument('--submissions', type=int, default=500, help='User submissions to post')
+        parser.add_argument('--batch-size', type=int, default=100, help='Submissions per batch request')
+        parser.add_argument('--polls', type=int, default=100000, help='Polls in the catalogue')
+        parser.add_argument('--active-polls', type=int, default=1000, help='Active polls in the catalogue')
+        parser.add_argument('--page', type=int, default=10000, help='Answer history page to fetch')
+        parser.add_argument('--page-rows', type=int, default=10000, help='Rows of the serialized pages')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests sent by the serving load test')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients of the load tests')
+        parser.add_argument('--repeat', type=int, default=100, help='Repetitions of timed queries and calls')
+        parser.add_argument('--json', help='Write options and results as JSON to this file')
+        parser.add_argument('--baseline', help='Fail on regressions against results JSON written by --json')
+        parser.add_argument('--tolerance', type=float, default=25,
+                            help='Percent a timing or throughput may be worse than the baseline')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        old_name = connection.settings_dict['NAME']
+        tmp_dir = None
+        if connection.vendor == 'sqlite' and not options['in_memory']:
+            # in-memory SQLite locks whole tables between threads, a file behaves like production
+            tmp_dir = tempfile.mkdtemp()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        try:
+            for name in scenarios:
+                results[name] = SCENARIOS[name](options, self.stdout)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if tmp_dir:
+                shutil.rmtree(tmp_dir)
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'options': {k: v for k, v in options.items() if k in BENCH_OPTIONS}, 'results': results},
+                          f, indent=2)
+        if baseline:
+            if {k: baseline['options'].get(k) for k in BENCH_OPTIONS} != \
+                    {k: options[k] for k in BENCH_OPTIONS}:
+                self.stderr.write('Baseline was recorded with other options, results may not be comparable')
+            regressions = compare_results(baseline['results'], results, options['tolerance'] / 100)
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write('No regressions against baseline')
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from api.ingest_queue import answer_queue, drain
+
+
+class Command(BaseCommand):
+    help = 'Store queued answer submissions with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Submissions stored per flush')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        queue = answer_queue()
+        while True:
+            taken = drain(queue, options['batch_size'])
+            if taken:
+                self.stdout.write(f'Stored {taken} submissions')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
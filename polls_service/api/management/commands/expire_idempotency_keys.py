@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api.submissions import expire_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete responses stored for Idempotency-Key retries older than IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Deleted {expire_idempotency_keys()} expired idempotency keys'))
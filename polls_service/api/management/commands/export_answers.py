@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_poll_answers
+from api.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Export all answers of a poll as csv or ndjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll', type=int, help='Poll id')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', dest='export_format')
+        parser.add_argument('--output', help='Output file, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Rows fetched per database round-trip')
+
+    def handle(self, *args, **options):
+        if not Poll.objects.filter(id=options['poll']).exists():
+            raise CommandError(f"Poll id:{options['poll']} does not exist")
+        chunks = export_poll_answers(options['poll'], options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.cache import CATALOGUE, invalidate
+from api.generator import GENERATE_CHUNK_SIZE, generate
+
+
+class Command(BaseCommand):
+    help = 'Bulk generate synthetic polls, questions, options and answers for load and scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=1000, help='Polls to create')
+        parser.add_argument('--questions', type=int, nargs=2, default=[5, 30], metavar=('MIN', 'MAX'),
+                            help='Questions per poll')
+        parser.add_argument('--options', type=int, nargs=2, default=[2, 6], metavar=('MIN', 'MAX'),
+                            help='Answer options per choise question')
+        parser.add_argument('--users', type=int, nargs=2, default=[100, 1000], metavar=('MIN', 'MAX'),
+                            help='Users answering every poll')
+        parser.add_argument('--text-share', type=float, default=0.3, help='Fraction of text questions')
+        parser.add_argument('--multi-share', type=float, default=0.3, help='Fraction of choise_multi questions')
+        parser.add_argument('--active-share', type=float, default=0.5, help='Fraction of active polls')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--chunk-size', type=int, default=GENERATE_CHUNK_SIZE, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        for name in ('questions', 'options', 'users'):
+            low, high = options[name]
+            if not 0 < low <= high:
+                raise CommandError(f'--{name} needs 0 < MIN <= MAX')
+        if options['text_share'] + options['multi_share'] > 1:
+            raise CommandError('--text-share and --multi-share add up to more than 1')
+        start = time.perf_counter()
+
+        def progress(written):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{written['answers']} answers of {written['submissions']} submissions, "
+                              f"{written['answers'] / elapsed:.0f} answers/s")
+
+        created = generate(options['polls'], options['questions'], options['options'], options['users'],
+                           options['text_share'], options['multi_share'], options['active_share'],
+                           options['seed'], options['chunk_size'], progress)
+        invalidate(CATALOGUE)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['polls']} polls, {created['questions']} questions, {created['submissions']} submissions "
+            f"and {created['answers']} answers in {time.perf_counter() - start:.1f} s"))
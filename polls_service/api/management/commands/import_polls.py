@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.cache import invalidate_polls
+from api.importer import import_polls
+from api.serializers import PollImportSerializer
+
+
+def load_definitions(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith(('.yaml', '.yml')):
+                from ruamel.yaml import YAML, YAMLError
+                try:
+                    return YAML(typ='safe').load(f)
+                except YAMLError as e:
+                    raise ValueError(e)
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise CommandError(f"Can't read {path}: {e}")
+
+
+class Command(BaseCommand):
+    help = 'Import polls with questions and answer options from a JSON or YAML list of polls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.json, .yaml or .yml file')
+
+    def handle(self, *args, **options):
+        definitions = load_definitions(options['path'])
+        serializer = PollImportSerializer(data=definitions, many=True)
+        if not serializer.is_valid():
+            raise CommandError(f'Invalid poll definitions: {serializer.errors}')
+        polls = import_polls(serializer.validated_data)
+        invalidate_polls([], catalogue=True)
+        self.stdout.write(self.style.SUCCESS(f"Imported polls: {', '.join(str(p.id) for p in polls)}"))
@@ -0,0 +1,28 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.cache import CATALOGUE, invalidate
+from api.models import Poll
+from api.purge import PURGE_BATCH_SIZE, PURGE_ORDER, purge_deleted, purgeable
+
+
+class Command(BaseCommand):
+    help = 'Move rows soft deleted more than --days ago to the archived row table in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Minimum age of soft deleted rows to purge')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Rows moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Count purgeable rows without moving them')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        if options['dry_run']:
+            # rows referenced only by rows purged before them are not counted yet
+            for model in PURGE_ORDER:
+                self.stdout.write(f'{model.__name__}: {purgeable(model, cutoff).count()} purgeable')
+            return
+        moved = purge_deleted(cutoff, options['batch_size'],
+                              lambda model, count: self.stdout.write(f'{model.__name__}: {count} rows archived'))
+        if moved[Poll]:
+            invalidate(CATALOGUE)
+        self.stdout.write(self.style.SUCCESS(f'Archived {sum(moved.values())} rows'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.tallies import rebuild_tallies, recount, stored_tally
+
+
+class Command(BaseCommand):
+    help = 'Rebuild poll result tallies from answers and verify them against a full recount'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, action='append', dest='polls', help='Poll id, all polls by default')
+        parser.add_argument('--verify-only', action='store_true', help="Verify tallies without rebuilding them")
+
+    def handle(self, *args, **options):
+        polls = options['polls']
+        if not options['verify_only']:
+            rebuild_tallies(polls)
+            self.stdout.write('Tallies rebuilt')
+        expected = recount(polls)
+        stored = stored_tally(polls)
+        mismatches = sorted((k for k in expected.keys() | stored.keys() if expected[k] != stored[k]),
+                            key=lambda k: tuple(i or 0 for i in k))
+        for poll, question, answer in mismatches:
+            self.stderr.write(f'poll:{poll} question:{question} answer_id:{answer} '
+                              f'stored {stored[(poll, question, answer)]}, '
+                              f'recounted {expected[(poll, question, answer)]}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} tallies differ from recount')
+        self.stdout.write(self.style.SUCCESS(f'{len(expected)} tallies verified'))
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from itertools import accumulate
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """
+    Prometheus histogram with labels kept in process memory
+    """
+
+    def __init__(self, name, documentation, buckets, lock=None):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = lock or threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            self.record(labels, value)
+
+    def record(self, labels, value):
+        """
+        observe for callers holding the histogram lock
+        """
+        series = self._series.get(labels)
+        if series is None:
+            # per bucket counts with +Inf last, cumulated on exposition
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self, labels):
+        """
+        Cumulative bucket counts, count and sum of a series
+        """
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                return None
+            counts, total = list(series[0]), series[1]
+        cumulative = list(accumulate(counts))
+        return cumulative[:-1], cumulative[-1], total
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            labels = sorted(self._series)
+        for label in labels:
+            counts, count, total = self.samples(label)
+            label_text = ','.join(f'{k}="{v}"' for k, v in label)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+        return '\n'.join(lines)
+
+
+# request histograms share a lock, a request is recorded with one acquisition
+REQUEST_LOCK = threading.Lock()
+REQUEST_DURATION = Histogram('polls_request_duration_seconds', 'Wall time of requests', DURATION_BUCKETS,
+                             REQUEST_LOCK)
+REQUEST_QUERIES = Histogram('polls_request_queries', 'SQL queries per request', QUERY_BUCKETS, REQUEST_LOCK)
+REQUEST_SQL = Histogram('polls_request_sql_seconds', 'SQL time per request', DURATION_BUCKETS, REQUEST_LOCK)
+REQUEST_RENDER = Histogram('polls_request_render_seconds', 'Response rendering time per request',
+                           DURATION_BUCKETS, REQUEST_LOCK)
+HISTOGRAMS = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_SQL, REQUEST_RENDER]
+
+
+class _QueryRecorder:
+    """
+    Database execute wrapper counting queries and their time, keeping SQL when capture is set
+    """
+
+    def __init__(self, capture):
+        self.count = 0
+        self.seconds = 0
+        self.queries = [] if capture else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.queries is not None:
+                self.queries.append((elapsed, sql))
+
+
+# query recorder of the request served by the current thread
+_current = threading.local()
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = getattr(_current, 'recorder', None)
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Wrap queries of the default database once per connection object: entering execute_wrapper
+    on every request costs more than the rest of the middleware, mostly in the connections lookup
+    """
+    if connection.alias == DEFAULT_DB_ALIAS and _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, query count, SQL time and rendering time of every request
+    per view name and method. Requests slower than METRICS_SLOW_REQUEST_MS are logged
+    to the api.metrics logger with their SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_ms = settings.METRICS_SLOW_REQUEST_MS
+        recorder = _QueryRecorder(capture=slow_ms is not None)
+        request._metrics_render = 0
+        outer = getattr(_current, 'recorder', None)
+        _current.recorder = recorder
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.recorder = outer
+        wall = time.perf_counter() - start
+        match = request.resolver_match
+        labels = (('view', match.view_name if match else 'unresolved'), ('method', request.method))
+        with REQUEST_LOCK:
+            REQUEST_DURATION.record(labels, wall)
+            REQUEST_QUERIES.record(labels, recorder.count)
+            REQUEST_SQL.record(labels, recorder.seconds)
+            REQUEST_RENDER.record(labels, request._metrics_render)
+        if slow_ms is not None and wall * 1000 >= slow_ms:
+            logger.warning('Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms SQL\n%s', request.method,
+                           request.path, labels[0][1], wall * 1000, recorder.count, recorder.seconds * 1000,
+                           '\n'.join(f'{elapsed * 1000:.1f} ms {sql}' for elapsed, sql in recorder.queries))
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def exposition():
+    return '\n'.join(h.exposition() for h in HISTOGRAMS) + '\n'
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def metrics_view(request):
+    """
+    Request histograms of this process in Prometheus text format
+    """
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
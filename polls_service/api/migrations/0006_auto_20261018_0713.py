@@ -0,0 +1,52 @@
+# Generated by Django 3.0.6 on 2026-10-18 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+
+
+def count_answers(apps, schema_editor):
+    AnswerTally = apps.get_model('api', 'AnswerTally')
+    UserPollAnswer = apps.get_model('api', 'UserPollAnswer')
+    UserPollQuestionAnswer = apps.get_model('api', 'UserPollQuestionAnswer')
+    counter = Counter()
+    for poll_id in UserPollAnswer.objects.filter(isdelete=False, poll__isnull=False).values_list('poll_id', flat=True):
+        counter[(poll_id, None, None)] += 1
+    answered = set()
+    answers = UserPollQuestionAnswer.objects.filter(isdelete=False, user_poll__isdelete=False,
+                                                    user_poll__poll__isnull=False, question__isnull=False)
+    for user_poll_id, poll_id, question_id, answer_id in answers.values_list('user_poll_id', 'user_poll__poll_id',
+                                                                             'question_id', 'answer_id_id'):
+        if (user_poll_id, question_id) not in answered:
+            counter[(poll_id, question_id, None)] += 1
+            answered.add((user_poll_id, question_id))
+        if answer_id:
+            counter[(poll_id, question_id, answer_id)] += 1
+    AnswerTally.objects.bulk_create([AnswerTally(poll_id=p, question_id=q, answer_id_id=a, count=n)
+                                     for (p, q, a), n in counter.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_auto_20200513_1725'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userpollquestionanswer',
+            name='user_poll',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='answers', to='api.UserPollAnswer'),
+        ),
+        migrations.CreateModel(
+            name='AnswerTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('answer_id', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.AnswerOptions')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='api.Poll')),
+                ('question', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.Question')),
+            ],
+        ),
+        migrations.RunPython(count_answers, migrations.RunPython.noop),
+    ]
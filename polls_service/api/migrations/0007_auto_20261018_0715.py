@@ -0,0 +1,17 @@
+# Generated by Django 3.0.6 on 2026-10-18 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_auto_20261018_0713'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['isdelete', 'end_date'], name='poll_active_idx'),
+        ),
+    ]
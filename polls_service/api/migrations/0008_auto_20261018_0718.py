@@ -0,0 +1,21 @@
+# Generated by Django 3.0.6 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_auto_20261018_0715'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpollanswer',
+            index=models.Index(fields=['user_id', 'isdelete', 'id'], name='user_answer_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpollquestionanswer',
+            index=models.Index(fields=['user_poll', 'question'], name='user_poll_question_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.0.6 on 2026-10-18 08:02
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+from collections import Counter
+
+
+def retire_duplicate_answers(apps, schema_editor):
+    """
+    Keep the latest live submission of every user and poll, soft delete the older ones
+    and recount tallies of the affected polls
+    """
+    AnswerTally = apps.get_model('api', 'AnswerTally')
+    UserPollAnswer = apps.get_model('api', 'UserPollAnswer')
+    UserPollQuestionAnswer = apps.get_model('api', 'UserPollQuestionAnswer')
+    live = UserPollAnswer.objects.filter(isdelete=False, poll__isnull=False)
+    duplicates = live.values('user_id', 'poll_id').annotate(n=Count('id'), latest=Max('id')).filter(n__gt=1)
+    poll_ids = set()
+    for row in duplicates:
+        live.filter(user_id=row['user_id'], poll_id=row['poll_id']).exclude(id=row['latest']).update(isdelete=True)
+        poll_ids.add(row['poll_id'])
+    if not poll_ids:
+        return
+    counter = Counter()
+    for poll_id in live.filter(poll_id__in=poll_ids).values_list('poll_id', flat=True):
+        counter[(poll_id, None, None)] += 1
+    answered = set()
+    answers = UserPollQuestionAnswer.objects.filter(isdelete=False, user_poll__isdelete=False,
+                                                    user_poll__poll_id__in=poll_ids, question__isnull=False)
+    for user_poll_id, poll_id, question_id, answer_id in answers.values_list('user_poll_id', 'user_poll__poll_id',
+                                                                             'question_id', 'answer_id_id'):
+        if (user_poll_id, question_id) not in answered:
+            counter[(poll_id, question_id, None)] += 1
+            answered.add((user_poll_id, question_id))
+        if answer_id:
+            counter[(poll_id, question_id, answer_id)] += 1
+    AnswerTally.objects.filter(poll_id__in=poll_ids).delete()
+    AnswerTally.objects.bulk_create([AnswerTally(poll_id=p, question_id=q, answer_id_id=a, count=n)
+                                     for (p, q, a), n in counter.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_auto_20261018_0718'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('response', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(retire_duplicate_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userpollanswer',
+            constraint=models.UniqueConstraint(condition=models.Q(isdelete=False), fields=('user_id', 'poll'), name='one_live_answer_per_user_poll'),
+        ),
+    ]
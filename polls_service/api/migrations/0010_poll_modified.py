@@ -0,0 +1,20 @@
+# Generated by Django 3.0.6 on 2026-10-18 08:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_auto_20261018_0802'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 3.0.6 on 2026-10-18 08:16
+
+from django.db import migrations, models
+from django.utils import timezone
+
+SOFT_DELETE_MODELS = ['AnswerOptions', 'AnswerType', 'Poll', 'Question', 'UserPollAnswer', 'UserPollQuestionAnswer']
+
+
+def stamp_deleted_rows(apps, schema_editor):
+    """
+    Rows soft deleted before deleted_at existed count as deleted now
+    """
+    now = timezone.now()
+    for name in SOFT_DELETE_MODELS:
+        apps.get_model('api', name).objects.filter(isdelete=True).update(deleted_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_poll_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=255)),
+                ('row_id', models.PositiveIntegerField()),
+                ('deleted_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.TextField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='poll',
+            name='poll_active_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userpollanswer',
+            name='user_answer_history_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userpollquestionanswer',
+            name='user_poll_question_idx',
+        ),
+        migrations.AddField(
+            model_name='answeroptions',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answertype',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpollanswer',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpollquestionanswer',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_deleted_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(isdelete=False), fields=['isdelete', 'end_date'], name='poll_live_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpollanswer',
+            index=models.Index(condition=models.Q(isdelete=False), fields=['user_id', 'id'], name='user_live_answer_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpollquestionanswer',
+            index=models.Index(condition=models.Q(isdelete=False), fields=['user_poll', 'question'], name='live_user_poll_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrow',
+            index=models.Index(fields=['table', 'row_id'], name='archived_row_idx'),
+        ),
+    ]
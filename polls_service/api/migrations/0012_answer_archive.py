@@ -0,0 +1,22 @@
+# Generated by Django 3.0.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_live_managers_and_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpollanswer',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='userpollanswer',
+            index=models.Index(condition=models.Q(archived=False), fields=['poll', 'id'], name='unarchived_poll_answer_idx'),
+        ),
+    ]
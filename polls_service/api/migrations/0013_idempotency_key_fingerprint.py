@@ -0,0 +1,24 @@
+# Generated by Django 3.0.6 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_answer_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='fingerprint',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
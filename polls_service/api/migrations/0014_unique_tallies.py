@@ -0,0 +1,40 @@
+# Generated by Django 3.0.6 on 2026-10-18 10:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_tallies(apps, schema_editor):
+    """
+    Concurrent first increments could insert several rows for a key, the first one gets their sum
+    """
+    AnswerTally = apps.get_model('api', 'AnswerTally')
+    duplicates = AnswerTally.objects.values('poll_id', 'question_id', 'answer_id_id') \
+        .annotate(rows=Count('id'), first=Min('id'), total=Sum('count')).filter(rows__gt=1)
+    for row in duplicates:
+        AnswerTally.objects.filter(poll_id=row['poll_id'], question_id=row['question_id'],
+                                   answer_id_id=row['answer_id_id']).exclude(id=row['first']).delete()
+        AnswerTally.objects.filter(id=row['first']).update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_idempotency_key_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tallies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='answertally',
+            constraint=models.UniqueConstraint(condition=models.Q(('answer_id__isnull', True), ('question__isnull', True)), fields=('poll',), name='one_poll_tally'),
+        ),
+        migrations.AddConstraint(
+            model_name='answertally',
+            constraint=models.UniqueConstraint(condition=models.Q(('answer_id__isnull', True), ('question__isnull', False)), fields=('poll', 'question'), name='one_question_tally'),
+        ),
+        migrations.AddConstraint(
+            model_name='answertally',
+            constraint=models.UniqueConstraint(condition=models.Q(answer_id__isnull=False), fields=('poll', 'question', 'answer_id'), name='one_answer_tally'),
+        ),
+    ]
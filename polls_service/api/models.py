@@ -1,43 +1,152 @@
 from django.db import models
+from django.utils import timezone
+
+LIVE = models.Q(isdelete=False)
 
 
 # Create your models here.
 
-class AnswerType(models.Model):
-    type = models.CharField(max_length=255)
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        return self.update(isdelete=True, deleted_at=timezone.now())
+
+
+class LiveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Manager of rows which are not soft deleted
+    """
+
+    def get_queryset(self):
+        return super(LiveManager, self).get_queryset().filter(LIVE)
+
+
+class SoftDeleteModel(models.Model):
+    """
+    Base of soft deleted models: objects holds live rows, all_objects all of them.
+    Rows soft deleted more than a while ago are moved to ArchivedRow by purge_deleted.
+    """
     isdelete = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = LiveManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
 
+    class Meta:
+        abstract = True
 
-class AnswerOptions(models.Model):
+    def soft_delete(self):
+        self.isdelete = True
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['isdelete', 'deleted_at'])
+
+
+class AnswerType(SoftDeleteModel):
+    type = models.CharField(max_length=255)
+
+
+class AnswerOptions(SoftDeleteModel):
     text = models.CharField(max_length=255)
-    isdelete = models.BooleanField(default=False)
 
 
-class Question(models.Model):
+class Question(SoftDeleteModel):
     text = models.CharField(max_length=1000)
     answer_type = models.ForeignKey(AnswerType, on_delete=models.SET_NULL, null=True)
     answer = models.ManyToManyField(AnswerOptions, blank=True)
-    isdelete = models.BooleanField(default=False)
 
 
-class Poll(models.Model):
+class Poll(SoftDeleteModel):
     name = models.CharField(max_length=255)
     start_date = models.DateField(blank=True, null=True)
     end_date = models.DateField(blank=True, null=True)
     description = models.TextField(blank=True)
     question = models.ManyToManyField(Question, blank=True)
-    isdelete = models.BooleanField(default=False)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # isdelete is constant in the partial index, SQLite only picks it over a scan
+            # in id order with an equality term on a leading column
+            models.Index(fields=['isdelete', 'end_date'], name='poll_live_end_date_idx', condition=LIVE),
+        ]
 
 
-class UserPollAnswer(models.Model):
+class UserPollAnswer(SoftDeleteModel):
     user_id = models.PositiveIntegerField()
     poll = models.ForeignKey(Poll, on_delete=models.SET_NULL, null=True, blank=False)
-    isdelete = models.BooleanField(default=False)
+    # answers moved to the poll answer archive file, see api.answer_archive
+    archived = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'id'], name='user_live_answer_history_idx', condition=LIVE),
+            models.Index(fields=['poll', 'id'], name='unarchived_poll_answer_idx', condition=models.Q(archived=False)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'poll'], condition=LIVE,
+                                    name='one_live_answer_per_user_poll'),
+        ]
 
 
-class UserPollQuestionAnswer(models.Model):
+class UserPollQuestionAnswer(SoftDeleteModel):
     user_poll = models.ForeignKey(UserPollAnswer, on_delete=models.SET_NULL, null=True, related_name='answers')
     question = models.ForeignKey(Question, on_delete=models.SET_NULL, null=True)
     answer = models.CharField(max_length=255, blank=True)
     answer_id = models.ForeignKey(AnswerOptions, on_delete=models.SET_NULL, blank=True, null=True)
-    isdelete = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_poll', 'question'], name='live_user_poll_question_idx', condition=LIVE),
+        ]
+
+
+class AnswerTally(models.Model):
+    """
+    Precomputed poll results.
+    Row without question counts poll responses, row without answer_id counts responses to the question,
+    other rows count answers with the answer option.
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='tallies')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, null=True)
+    answer_id = models.ForeignKey(AnswerOptions, on_delete=models.CASCADE, null=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # one row per key, NULL columns are covered by separate partial constraints
+        constraints = [
+            models.UniqueConstraint(fields=['poll'], condition=models.Q(question__isnull=True, answer_id__isnull=True),
+                                    name='one_poll_tally'),
+            models.UniqueConstraint(fields=['poll', 'question'],
+                                    condition=models.Q(question__isnull=False, answer_id__isnull=True),
+                                    name='one_question_tally'),
+            models.UniqueConstraint(fields=['poll', 'question', 'answer_id'],
+                                    condition=models.Q(answer_id__isnull=False), name='one_answer_tally'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request made with an Idempotency-Key header, returned again to retries of the same
+    request with the same key until IDEMPOTENCY_KEY_TTL_HOURS pass. fingerprint is a hash of the request body.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status = models.PositiveSmallIntegerField()
+    response = models.TextField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class ArchivedRow(models.Model):
+    """
+    Soft deleted row moved out of its table by purge_deleted, data is the row
+    in Django's JSON serialization format and can be loaded back with loaddata
+    """
+    table = models.CharField(max_length=255)
+    row_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'row_id'], name='archived_row_idx'),
+        ]
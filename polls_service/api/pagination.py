@@ -0,0 +1,42 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination on id with opaque cursors and without count query
+    """
+    ordering = 'id'
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination by default, keyset pagination when the request has
+    ?pagination=cursor or a cursor returned by a previous keyset page
+    """
+    pagination_query_param = 'pagination'
+    keyset_class = KeysetPagination
+    keyset = None
+
+    def keyset_requested(self, request):
+        return (request.query_params.get(self.pagination_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super(PageNumberOrKeysetPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super(PageNumberOrKeysetPagination, self).get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset:
+            return self.keyset.to_html()
+        return super(PageNumberOrKeysetPagination, self).to_html()
+
+    def get_schema_fields(self, view):
+        return super(PageNumberOrKeysetPagination, self).get_schema_fields(view) + \
+            self.keyset_class().get_schema_fields(view)
@@ -0,0 +1,75 @@
+import json
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from .models import AnswerOptions, AnswerType, ArchivedRow, Poll, Question, UserPollAnswer, UserPollQuestionAnswer
+
+PURGE_BATCH_SIZE = 1000
+
+# referencing models first, a row is purged once nothing points to it
+PURGE_ORDER = [UserPollAnswer, UserPollQuestionAnswer, Poll, Question, AnswerOptions, AnswerType]
+
+# rows archived and deleted together with their purged parent: model -> (child model, foreign key)
+PURGE_CHILDREN = {UserPollAnswer: (UserPollQuestionAnswer, 'user_poll')}
+
+
+def purgeable(model, cutoff):
+    """
+    Rows of the model soft deleted before cutoff which no row points to with a SET_NULL
+    foreign key, other than the children purged with them. Cascading rows (tallies)
+    and many to many links are deleted with the row.
+    """
+    queryset = model.all_objects.filter(isdelete=True, deleted_at__lt=cutoff)
+    for rel in model._meta.related_objects:
+        if rel.one_to_many and rel.on_delete is models.SET_NULL and \
+                PURGE_CHILDREN.get(model) != (rel.related_model, rel.field.name):
+            referencing = rel.related_model._base_manager.filter(**{rel.field.name: OuterRef('pk')})
+            queryset = queryset.filter(~Exists(referencing))
+    return queryset.order_by('pk')
+
+
+def archived_rows(objs):
+    return [ArchivedRow(table=obj._meta.db_table, row_id=obj.pk, deleted_at=obj.deleted_at,
+                        data=json.dumps(item, cls=DjangoJSONEncoder))
+            for obj, item in zip(objs, serializers.serialize('python', objs))]
+
+
+def purge_batch(model, cutoff, batch_size=PURGE_BATCH_SIZE):
+    """
+    Move up to batch_size purgeable rows of the model with their children to ArchivedRow
+    in one transaction, return the number of archived rows, children included
+    """
+    ids = list(purgeable(model, cutoff).values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    # archived many to many links include deleted rows
+    links = [Prefetch(f.name, queryset=f.related_model.all_objects.all()) for f in model._meta.many_to_many]
+    with transaction.atomic():
+        objs = list(model.all_objects.filter(pk__in=ids).prefetch_related(*links))
+        children = None
+        if model in PURGE_CHILDREN:
+            child_model, fk = PURGE_CHILDREN[model]
+            children = child_model.all_objects.filter(**{f'{fk}__in': ids})
+            objs = list(children) + objs
+        ArchivedRow.objects.bulk_create(archived_rows(objs))
+        if children is not None:
+            children.delete()
+        model.all_objects.filter(pk__in=ids).delete()
+    return len(objs)
+
+
+def purge_deleted(cutoff, batch_size=PURGE_BATCH_SIZE, progress=lambda model, moved: None):
+    """
+    Move all rows soft deleted before cutoff to ArchivedRow in batches, return archived rows per model
+    """
+    moved = {}
+    for model in PURGE_ORDER:
+        moved[model] = 0
+        while True:
+            count = purge_batch(model, cutoff, batch_size)
+            if not count:
+                break
+            moved[model] += count
+            progress(model, moved[model])
+    return moved
@@ -0,0 +1,46 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer writing compact responses with orjson when it is installed.
+
+    Output is byte for byte the one of JSONRenderer: datetimes, decimals and other
+    non-JSON types go through the same encoder and \\u2028, \\u2029 are escaped.
+    Floats below 1e-4 or from 1e16 up are written without the exponent sign,
+    API responses have none. Indented output and the stdlib fallback use JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser reading UTF-8 request bodies with orjson when it is installed.
+    NaN and Infinity are rejected as in strict JSONParser, integers are limited to 64 bits.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super(FastJSONParser, self).parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
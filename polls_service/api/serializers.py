@@ -1,6 +1,14 @@
-from django.db import transaction
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import Poll, Question, AnswerType, AnswerOptions, UserPollAnswer, UserPollQuestionAnswer
+from .answer_archive import archived_answers
+from .answer_types import answer_types
+from .cache import invalidate_question
+from .importer import resolve_answer_options
+from .models import Poll, Question, AnswerOptions, UserPollAnswer, UserPollQuestionAnswer
+from .submissions import live_submissions, save_submissions
+from .validation import PollAnswerValidator, answered_error, to_poll_id
 
 
 class PollSerializer(serializers.HyperlinkedModelSerializer):
@@ -31,8 +39,17 @@ class AnswerOptionsSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['id', 'text']
 
 
+class AnswerTypeField(serializers.CharField):
+    """
+    Answer type name of the answer_type_id, resolved by the answer type registry
+    """
+
+    def to_representation(self, value):
+        return answer_types.name_of(value)
+
+
 class QuestionSerializer(serializers.HyperlinkedModelSerializer):
-    answer_type = serializers.CharField(source="answer_type.type")
+    answer_type = AnswerTypeField(source="answer_type_id")
     answer = AnswerOptionsSerializer(many=True, required=False)
 
     class Meta:
@@ -40,12 +57,11 @@ class QuestionSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['id', 'text', 'answer_type', 'answer']
 
     def validate(self, data):
-        if data.get('answer_type'):
-            try:
-                data['answer_type'] = AnswerType.objects.get(type=data['answer_type']['type'])
-            except AnswerType.DoesNotExist:
+        if data.get('answer_type_id'):
+            data['answer_type'] = answer_types.get(data.pop('answer_type_id'))
+            if data['answer_type'] is None:
                 raise serializers.ValidationError("Wrong answer_type")
-            if data['answer_type'].type == 'text' and data.get('answer', None):
+            if data['answer_type'].id == answer_types.id_of('text') and data.get('answer', None):
                 raise serializers.ValidationError("Can't setup answer if answer_type is text")
         return data
 
@@ -53,12 +69,15 @@ class QuestionSerializer(serializers.HyperlinkedModelSerializer):
         answers = validated_data.pop('answer', None)
         for k, v in validated_data.items():
             setattr(instance, k, v)
-        instance.answer.clear()
-        if answers:
-            for a in answers:
-                a = AnswerOptions.objects.get_or_create(text=a['text'])
-                instance.answer.add(a[0].id)
-        instance.save()
+        with transaction.atomic():
+            instance.save()
+            new_ids = set(resolve_answer_options(a['text'] for a in answers or []).values())
+            current_ids = set(instance.answer.values_list('id', flat=True))
+            if current_ids - new_ids:
+                instance.answer.remove(*(current_ids - new_ids))
+            if new_ids - current_ids:
+                instance.answer.add(*sorted(new_ids - current_ids))
+        invalidate_question(instance)
         return instance
 
     def create(self, validated_data):
@@ -67,28 +86,38 @@ class QuestionSerializer(serializers.HyperlinkedModelSerializer):
         with transaction.atomic():
             q_inst = super(QuestionSerializer, self).create(validated_data)
             if answers:
-                for a in answers:
-                    a = AnswerOptions.objects.get_or_create(text=a['text'])
-                    q_inst.answer.add(a[0].id)
-                    q_inst.save()
+                option_ids = resolve_answer_options(a['text'] for a in answers)
+                q_inst.answer.add(*dict.fromkeys(option_ids[a['text']] for a in answers))
             poll = Poll.objects.get(id=poll)
             poll.question.add(q_inst)
-            poll.save()
-            q_inst.save()
+        invalidate_question(q_inst)
         return q_inst
 
 
+class PollImportSerializer(PollSerializer):
+    questions = QuestionSerializer(many=True, required=False)
+
+    class Meta(PollSerializer.Meta):
+        fields = PollSerializer.Meta.fields + ['questions']
+
+
 class UserPollQuestionAnswerSerializer(serializers.HyperlinkedModelSerializer):
-    question = serializers.IntegerField(source='question.id')
-    answer_id = serializers.IntegerField(source='answer_id.id', required=False)
+    question = serializers.IntegerField(source='question_id')
+    answer_id = serializers.IntegerField(source='answer_id_id', required=False)
 
     class Meta:
         model = UserPollQuestionAnswer
         fields = ['question', 'answer', 'answer_id']
 
+    def to_representation(self, instance):
+        data = super(UserPollQuestionAnswerSerializer, self).to_representation(instance)
+        if data['answer_id'] is None:
+            del data['answer_id']
+        return data
+
 
 class UserPollAnswerSerializer(serializers.HyperlinkedModelSerializer):
-    poll = serializers.CharField(source="poll.id")
+    poll = serializers.CharField(source="poll_id")
     answers = UserPollQuestionAnswerSerializer(many=True)
 
     class Meta:
@@ -96,40 +125,101 @@ class UserPollAnswerSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['user_id', 'poll', 'answers']
 
     def validate(self, data):
-        data['poll'] = Poll.objects.get(id=data['poll']['id'])
-        cur_poll_q = Question.objects.filter(isdelete=False, poll=data['poll'])
-        cur_poll_q = {q.id: q for q in cur_poll_q}
-        for vq in data['answers']:
-            if vq['question']['id'] not in cur_poll_q.keys():
-                raise serializers.ValidationError(f"Question id:{vq['question']['id']} not in poll id:"
-                                                  f" {data['poll'].id}")
-            question_answer_type = cur_poll_q[vq['question']['id']].answer_type.type
-            if question_answer_type == 'text' and not vq.get('answer'):
-                raise serializers.ValidationError(f"Question id:{vq['question']['id']} type text requires answer field")
-            if question_answer_type in ['choise', 'choise_multi'] and not vq.get('answer_id'):
-                raise serializers.ValidationError(f"Question id:{vq['question']['id']} type {question_answer_type}"
-                                                  f" requires answer_id field")
-            if vq.get('answer_id'):
-                allowed_answer = {a.id:a for a in cur_poll_q[vq['question']['id']].answer.all()}
-                if vq['answer_id']['id'] not in allowed_answer.keys():
-                    raise serializers.ValidationError(f"Answer id:{vq['answer_id']['id']}, not allowed for question "
-                                                      f"id:{vq['question']['id']}")
-                vq['answer_id'] = AnswerOptions.objects.get(id=vq['answer_id']['id'])
-            vq['question'] = cur_poll_q[vq['question']['id']]
+        poll_id = to_poll_id(data.pop('poll_id'))
+        validators = self.context.get('poll_validators', {})
+        self.poll_validator = validators[poll_id] if poll_id in validators else PollAnswerValidator.for_poll(poll_id)
+        data['poll'] = self.poll_validator.poll
+        self.poll_validator.validate(data['answers'])
+        if settings.ANSWER_SUBMISSION_POLICY == 'reject' and self.context.get('check_duplicates', True):
+            key = (data['user_id'], poll_id)
+            existing = self.context.get('live_submissions')
+            if key in (live_submissions([key]) if existing is None else existing):
+                raise answered_error(*key)
         return data
 
     def create(self, validated_data):
-        answers = validated_data['answers']
-        up_inst = UserPollAnswer.objects.create(**{'user_id': validated_data['user_id'],'poll': validated_data['poll']})
-        with transaction.atomic():
-            for a in answers:
-                q = a['question']
-                first_answer = UserPollQuestionAnswer.objects.filter(user_poll=up_inst, question=q)
-                if q.answer_type.type in ['text', 'choise'] and first_answer:
-                    raise serializers.ValidationError("Multiple answers are possible only to choise_multi question")
-                a = UserPollQuestionAnswer.objects.create(user_poll=up_inst, **a)
-                a.save()
-            up_inst.save()
-        return up_inst
-
-
+        self.poll_validator.check_single_answers(validated_data['answers'])
+        try:
+            return save_submissions([validated_data])[0]
+        except IntegrityError:
+            # a concurrent request stored an answer of the user to the poll first
+            raise answered_error(validated_data['user_id'], validated_data['poll'].id)
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+class ValuesSerializer:
+    """
+    Read-only stand-in for a model serializer working on values() rows: a page is
+    represented as plain dicts with a query per nested relation and no field objects.
+    The output is the one of the model serializer.
+    """
+    fields = ()
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.fields)
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        data = self.to_representation(rows) if rows else []
+        return data if self.many else data[0]
+
+    def to_representation(self, rows):
+        raise NotImplementedError
+
+
+class PollValuesSerializer(ValuesSerializer):
+    fields = ('id', 'name', 'start_date', 'end_date', 'description')
+
+    def to_representation(self, rows):
+        return [{'id': r['id'], 'name': r['name'], 'start_date': _date(r['start_date']),
+                 'end_date': _date(r['end_date']), 'description': r['description']} for r in rows]
+
+
+class QuestionValuesSerializer(ValuesSerializer):
+    fields = ('id', 'text', 'answer_type_id')
+
+    def to_representation(self, rows):
+        options = {r['id']: [] for r in rows}
+        for question_id, option_id, text in Question.answer.through.objects \
+                .filter(question_id__in=list(options), answeroptions__isdelete=False) \
+                .order_by('question_id', 'answeroptions_id') \
+                .values_list('question_id', 'answeroptions_id', 'answeroptions__text'):
+            options[question_id].append({'id': option_id, 'text': text})
+        return [{'id': r['id'], 'text': r['text'],
+                 'answer_type': None if r['answer_type_id'] is None else answer_types.name_of(r['answer_type_id']),
+                 'answer': options[r['id']]} for r in rows]
+
+
+class UserPollAnswerValuesSerializer(ValuesSerializer):
+    fields = ('id', 'user_id', 'poll_id', 'archived')
+
+    def to_representation(self, rows):
+        """
+        Answers of archived submissions are read from the poll answer archive files
+        """
+        answers = {r['id']: [] for r in rows}
+        archived = defaultdict(list)
+        for r in rows:
+            if r['archived']:
+                archived[r['poll_id']].append(r['id'])
+        found = list(UserPollQuestionAnswer.objects
+                     .filter(user_poll_id__in=[r['id'] for r in rows if not r['archived']]).order_by('id')
+                     .values_list('user_poll_id', 'question_id', 'answer', 'answer_id_id'))
+        for poll_id, ids in archived.items():
+            found.extend(archived_answers(poll_id, ids))
+        for user_poll_id, question_id, answer, answer_id in found:
+            item = {'question': question_id, 'answer': answer}
+            if answer_id is not None:
+                item['answer_id'] = answer_id
+            answers[user_poll_id].append(item)
+        return [{'user_id': r['user_id'], 'poll': None if r['poll_id'] is None else str(r['poll_id']),
+                 'answers': answers[r['id']]} for r in rows]
@@ -0,0 +1,61 @@
+import gzip
+import hashlib
+from django.utils.http import quote_etag
+from .cache import cached, poll_scope
+from .models import Poll, Question
+from .renderers import FastJSONRenderer
+from .serializers import PollValuesSerializer, QuestionValuesSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# content codings in order of preference
+SNAPSHOT_ENCODINGS = ('br', 'gzip', 'identity')
+
+
+def compile_snapshot(poll_id):
+    """
+    The poll with its live questions, answer types and options as one JSON document,
+    encoded ahead of time: {encoding: (etag, body)} with br when brotli is installed.
+    None for a missing or deleted poll.
+    """
+    poll = PollValuesSerializer.values(Poll.objects.filter(pk=poll_id)).first()
+    if poll is None:
+        return None
+    document = PollValuesSerializer(poll).data
+    questions = Question.objects.filter(poll__id=poll_id).order_by('id')
+    document['questions'] = QuestionValuesSerializer(QuestionValuesSerializer.values(questions), many=True).data
+    body = FastJSONRenderer().render(document)
+    digest = hashlib.md5(body).hexdigest()
+    snapshot = {'identity': (quote_etag(digest), body),
+                'gzip': (quote_etag(f'{digest}-gzip'), gzip.compress(body, 9, mtime=0))}
+    if brotli is not None:
+        snapshot['br'] = (quote_etag(f'{digest}-br'), brotli.compress(body))
+    return snapshot
+
+
+def poll_snapshot(poll_id):
+    """
+    Compiled snapshot from the polls cache, compiled again after the poll scope is invalidated
+    """
+    return cached(poll_scope(poll_id), 'snapshot', lambda: compile_snapshot(poll_id))
+
+
+def preferred_encoding(accept_encoding, snapshot):
+    """
+    Most preferred encoding of the snapshot allowed by an Accept-Encoding header
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        try:
+            q = float(params.strip()[2:]) if params.strip().startswith('q=') else 1
+        except ValueError:
+            q = 0
+        accepted[coding.strip().lower()] = q
+    for encoding in SNAPSHOT_ENCODINGS:
+        if encoding in snapshot and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
@@ -0,0 +1,140 @@
+import datetime
+import hashlib
+import json
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .answer_archive import archived_answers
+from .bulk import bulk_create_with_ids, chunked
+from .models import IdempotencyKey, UserPollAnswer, UserPollQuestionAnswer
+from .tallies import add_to_tallies, submissions_tally
+
+SUBMISSIONS_CHUNK_SIZE = 500
+
+
+def live_submissions(pairs):
+    """
+    Ids of live submissions keyed by (user_id, poll_id) for the given pairs,
+    looked up through the one_live_answer_per_user_poll unique index
+    """
+    pairs = set(pairs)
+    poll_ids = {poll_id for _, poll_id in pairs}
+    found = {}
+    for user_ids in chunked({user_id for user_id, _ in pairs}):
+        rows = UserPollAnswer.objects.filter(user_id__in=user_ids, poll_id__in=poll_ids) \
+            .values_list('user_id', 'poll_id', 'id')
+        found.update(((user_id, poll_id), pk) for user_id, poll_id, pk in rows if (user_id, poll_id) in pairs)
+    return found
+
+
+def submission_key(submission):
+    return submission['user_id'], submission['poll'].id
+
+
+def without_duplicates(submissions):
+    """
+    Split submissions into the first one of every user and poll without a live submission,
+    and the rest
+    """
+    existing = live_submissions(submission_key(s) for s in submissions)
+    unique, duplicates = [], []
+    for s in submissions:
+        key = submission_key(s)
+        if key in existing:
+            duplicates.append(s)
+        else:
+            existing[key] = None
+            unique.append(s)
+    return unique, duplicates
+
+
+def retire_submissions(ids):
+    """
+    Soft delete submissions replaced by newer ones and take them out of poll tallies
+    """
+    answers = list(UserPollQuestionAnswer.objects.filter(user_poll_id__in=ids, question__isnull=False)
+                   .values_list('user_poll_id', 'question_id', 'answer_id_id'))
+    polls, archived = {}, defaultdict(list)
+    for pk, poll_id, is_archived in UserPollAnswer.objects.filter(id__in=ids).values_list('id', 'poll_id', 'archived'):
+        polls[pk] = poll_id
+        if is_archived:
+            archived[poll_id].append(pk)
+    for poll_id, archived_ids in archived.items():
+        answers.extend((user_poll_id, question_id, answer_id) for user_poll_id, question_id, _, answer_id
+                       in archived_answers(poll_id, archived_ids) if question_id is not None)
+    counter = Counter()
+    for poll_id in polls.values():
+        counter[(poll_id, None, None)] -= 1
+    answered = set()
+    for user_poll_id, question_id, answer_id in answers:
+        poll_id = polls[user_poll_id]
+        if (user_poll_id, question_id) not in answered:
+            counter[(poll_id, question_id, None)] -= 1
+            answered.add((user_poll_id, question_id))
+        if answer_id:
+            counter[(poll_id, question_id, answer_id)] -= 1
+    UserPollAnswer.objects.filter(id__in=ids).soft_delete()
+    add_to_tallies(counter)
+
+
+def save_submissions(submissions, chunk_size=SUBMISSIONS_CHUNK_SIZE):
+    """
+    Persist validated user submissions with chunked bulk inserts.
+
+    Every chunk is written in its own transaction together with its poll tallies. Parent rows
+    are bulk inserted when the backend returns primary keys from bulk inserts, otherwise they
+    are saved one by one.
+
+    A user has one live submission per poll. With the 'replace' ANSWER_SUBMISSION_POLICY the
+    previous submission is retired and the last of several submissions of a user to a poll is
+    stored, the returned list holds it in place of the others. With the 'reject' policy callers
+    leave duplicates out, a concurrent duplicate fails on the unique constraint with IntegrityError.
+    """
+    replace = settings.ANSWER_SUBMISSION_POLICY == 'replace'
+    if replace:
+        last = {submission_key(s): i for i, s in enumerate(submissions)}
+        stored = [submissions[i] for i in sorted(last.values())]
+    else:
+        stored = submissions
+    created = []
+    for start in range(0, len(stored), chunk_size):
+        chunk = stored[start:start + chunk_size]
+        with transaction.atomic():
+            if replace:
+                previous = live_submissions(submission_key(s) for s in chunk)
+                if previous:
+                    retire_submissions(list(previous.values()))
+            parents = bulk_create_with_ids(UserPollAnswer,
+                                           [UserPollAnswer(user_id=s['user_id'], poll=s['poll']) for s in chunk])
+            UserPollQuestionAnswer.objects.bulk_create([UserPollQuestionAnswer(user_poll=p, **a)
+                                                        for p, s in zip(parents, chunk) for a in s['answers']])
+            add_to_tallies(submissions_tally(chunk))
+        created.extend(parents)
+    if replace:
+        by_key = {(p.user_id, p.poll_id): p for p in created}
+        created = [by_key[submission_key(s)] for s in submissions]
+    return created
+
+
+def request_fingerprint(data):
+    """
+    Hash of a parsed request body, equal for bodies differing only in key order and whitespace
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+def idempotency_keys():
+    """
+    Idempotency keys which did not expire yet
+    """
+    cutoff = timezone.now() - datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    return IdempotencyKey.objects.filter(created__gte=cutoff)
+
+
+def expire_idempotency_keys():
+    """
+    Delete expired idempotency keys, return the number of deleted keys
+    """
+    cutoff = timezone.now() - datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    return IdempotencyKey.objects.filter(created__lt=cutoff).delete()[0]
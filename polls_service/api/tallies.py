@@ -0,0 +1,109 @@
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from .answer_archive import archived_tally
+from .answer_types import answer_types
+from .bulk import chunked
+from .models import AnswerTally, UserPollAnswer, UserPollQuestionAnswer
+
+
+def submissions_tally(submissions):
+    """
+    Count tally increments of validated submissions keyed by (poll_id, question_id, answer_id)
+    """
+    counter = Counter()
+    for s in submissions:
+        poll_id = s['poll'].id
+        counter[(poll_id, None, None)] += 1
+        answered = set()
+        for a in s['answers']:
+            question_id = a['question_id']
+            if question_id not in answered:
+                counter[(poll_id, question_id, None)] += 1
+                answered.add(question_id)
+            if a.get('answer_id_id'):
+                counter[(poll_id, question_id, a['answer_id_id'])] += 1
+    return counter
+
+
+def tallies_of(poll_ids=None):
+    tallies = AnswerTally.objects.all()
+    if poll_ids is not None:
+        tallies = tallies.filter(poll_id__in=poll_ids)
+    return tallies
+
+
+def tally_ids(keys):
+    return {(p, q, a): pk for pk, p, q, a in tallies_of({k[0] for k in keys})
+            .values_list('id', 'poll_id', 'question_id', 'answer_id_id')}
+
+
+def add_to_tallies(counter):
+    """
+    Increment tallies with one UPDATE per distinct increment. Missing rows are inserted with a zero count
+    first, rows inserted meanwhile by a concurrent transaction are skipped and incremented as well.
+    """
+    existing = tally_ids(counter)
+    missing = [key for key in counter if key not in existing]
+    if missing:
+        AnswerTally.objects.bulk_create([AnswerTally(poll_id=p, question_id=q, answer_id_id=a, count=0)
+                                         for p, q, a in missing], ignore_conflicts=True)
+        existing = tally_ids(counter)
+    by_increment = defaultdict(list)
+    for key, n in counter.items():
+        by_increment[n].append(existing[key])
+    for n, ids in by_increment.items():
+        for ids_chunk in chunked(ids):
+            AnswerTally.objects.filter(id__in=ids_chunk).update(count=F('count') + n)
+
+
+def recount(poll_ids=None):
+    """
+    Full recount of live answers, archived ones included, same keys as submissions_tally
+    """
+    submissions = UserPollAnswer.objects.filter(poll__isnull=False)
+    answers = UserPollQuestionAnswer.objects.filter(user_poll__isdelete=False,
+                                                    user_poll__poll__isnull=False, question__isnull=False)
+    if poll_ids is not None:
+        submissions = submissions.filter(poll_id__in=poll_ids)
+        answers = answers.filter(user_poll__poll_id__in=poll_ids)
+    counter = Counter()
+    for row in submissions.values('poll_id').annotate(n=Count('id')):
+        counter[(row['poll_id'], None, None)] = row['n']
+    for row in answers.values('user_poll__poll_id', 'question_id').annotate(n=Count('user_poll', distinct=True)):
+        counter[(row['user_poll__poll_id'], row['question_id'], None)] = row['n']
+    for row in answers.filter(answer_id__isnull=False).values('user_poll__poll_id', 'question_id', 'answer_id_id') \
+            .annotate(n=Count('id')):
+        counter[(row['user_poll__poll_id'], row['question_id'], row['answer_id_id'])] = row['n']
+    counter.update(archived_tally(poll_ids))
+    return counter
+
+
+def stored_tally(poll_ids=None):
+    return Counter({(p, q, a): n for p, q, a, n in tallies_of(poll_ids)
+                   .values_list('poll_id', 'question_id', 'answer_id_id', 'count') if n})
+
+
+def rebuild_tallies(poll_ids=None):
+    with transaction.atomic():
+        tallies_of(poll_ids).delete()
+        AnswerTally.objects.bulk_create([AnswerTally(poll_id=p, question_id=q, answer_id_id=a, count=n)
+                                         for (p, q, a), n in recount(poll_ids).items()])
+
+
+def poll_results(poll):
+    """
+    Poll results built from tallies of its live questions
+    """
+    counts = {(q, a): n for q, a, n in poll.tallies.values_list('question_id', 'answer_id_id', 'count')}
+    questions = []
+    for q in poll.question.prefetch_related('answer').order_by('id'):
+        answer_type = answer_types.name_of(q.answer_type_id)
+        result = {'id': q.id, 'text': q.text, 'answer_type': answer_type, 'responses': counts.get((q.id, None), 0)}
+        if answer_type == 'text':
+            result['text_answers'] = result['responses']
+        else:
+            result['answers'] = [{'id': a.id, 'text': a.text, 'count': counts.get((q.id, a.id), 0)}
+                                 for a in sorted(q.answer.all(), key=lambda a: a.id)]
+        questions.append(result)
+    return {'poll': poll.id, 'responses': counts.get((None, None), 0), 'questions': questions}
@@ -1,12 +1,48 @@
+import asyncio
 import datetime
-from .serializers import QuestionSerializer, UserPollAnswerSerializer
+import decimal
+import gzip
+import json
+import os
+import runpy
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from .answer_types import answer_types
+from .asgi import get_asgi_application
+from .authentication import token_cache
+from .backends.sqlite3.base import DatabaseWrapper
+from .benchmarks import compare_results
+from .cache import polls_cache, reset_stats
+from .loadtest import asgi_request
+from .metrics import REQUEST_QUERIES, reset_metrics
+from .pagination import KeysetPagination
+from .renderers import FastJSONParser, FastJSONRenderer
+from .snapshot import preferred_encoding
+from .submissions import retire_submissions, without_duplicates
+from .tallies import add_to_tallies, tally_ids
+from .serializers import PollSerializer, PollValuesSerializer, QuestionSerializer, QuestionValuesSerializer, \
+    UserPollAnswerSerializer, UserPollAnswerValuesSerializer
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase, APIClient
 from oauth2_provider.models import AccessToken, Application
+from django.core import serializers
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, connections, transaction
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from .models import Poll, Question, AnswerOptions, AnswerType, UserPollAnswer
+from .models import Poll, Question, AnswerOptions, AnswerTally, AnswerType, ArchivedRow, IdempotencyKey, \
+    UserPollAnswer, UserPollQuestionAnswer
 from rest_framework.reverse import reverse
 from rest_framework import status
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 
 today = datetime.datetime.now().strftime("%Y-%m-%d")
 yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
@@ -86,9 +122,15 @@ class ApiUserTestClient(APITestCase):
         lonely_question = Question.objects.create(text='lonely question without poll',
                                                   answer_type=AnswerType.objects.get(id=1))
         lonely_question.save()
+        answer_types.reset()
 
     def tearDown(self):
         self.logout()
+        polls_cache().clear()
+        reset_stats()
+        answer_types.reset()
+        token_cache.clear()
+        reset_metrics()
 
     def login(self):
         self.client.credentials(Authorization='Bearer {}'.format(self.access_token.token))
@@ -136,6 +178,40 @@ class PollViewSetTestCase(ApiUserTestClient):
             ]
         }
 
+        self.import_polls_input = [
+            {
+                'name': 'imported_poll',
+                'start_date': yesterday,
+                'end_date': tomorrow,
+                'description': 'test',
+                'questions': [
+                    {'text': 'imported text question', 'answer_type': 'text'},
+                    {'text': 'imported choise question', 'answer_type': 'choise',
+                     'answer': [{'text': 'choise2'}, {'text': 'choise3'}]},
+                ]
+            },
+            {'name': 'imported_poll_2', 'end_date': tomorrow}
+        ]
+
+        self.import_polls_yaml = '''
+- name: imported_poll
+  end_date: 2100-01-01
+  questions:
+  - text: imported text question
+    answer_type: text
+  - text: imported choise question
+    answer_type: choise
+    answer:
+    - text: choise2
+    - text: choise3
+'''
+
+        self.import_polls_questions = [
+            {'id': 5, 'text': 'imported text question', 'answer_type': 'text', 'answer': []},
+            {'id': 6, 'text': 'imported choise question', 'answer_type': 'choise',
+             'answer': [{'id': 2, 'text': 'choise2'}, {'id': 3, 'text': 'choise3'}]},
+        ]
+
         self.change_start_date_input = {
             'start_date': today,
         }
@@ -185,6 +261,90 @@ class PollViewSetTestCase(ApiUserTestClient):
         self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(r.data, self.change_start_date_error)
 
+    def test_import_polls(self):
+        self.login()
+        r = self.client.post(reverse('poll-import-polls'), data=self.import_polls_input, format='json')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([p['name'] for p in r.data], ['imported_poll', 'imported_poll_2'])
+        r = self.client.get(reverse('poll-question-list', args=(r.data[0]['id'],)))
+        self.assertEqual(r.data['results'], self.import_polls_questions)
+
+    def test_import_polls_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml') as f:
+            f.write(self.import_polls_yaml)
+            f.flush()
+            call_command('import_polls', f.name, stdout=StringIO())
+        poll = Poll.objects.get(name='imported_poll')
+        r = self.client.get(reverse('poll-question-list', args=(poll.id,)))
+        self.assertEqual(r.data['results'], self.import_polls_questions)
+
+    def test_generate_data_command(self):
+        out = StringIO()
+        call_command('generate_data', '--polls', '3', '--questions', '2', '4', '--users', '5', '10',
+                     '--chunk-size', '20', stdout=out)
+        self.assertIn('Created 3 polls', out.getvalue())
+        polls = Poll.objects.filter(name__startswith='generated poll')
+        self.assertEqual(polls.count(), 3)
+        poll = polls.first()
+        submissions = UserPollAnswer.objects.filter(poll=poll).count()
+        self.assertTrue(5 <= submissions <= 10)
+        self.assertEqual(UserPollQuestionAnswer.objects.filter(user_poll__poll=poll).values('question')
+                         .distinct().count(), poll.question.count())
+        call_command('rebuild_tallies', '--verify-only', stdout=out)
+        r = self.client.get(reverse('poll-results', args=(poll.id,)))
+        self.assertEqual(r.data['responses'], submissions)
+        # ids of rows created normally follow the generated ones
+        created = Poll.objects.create(name='after generate', start_date=yesterday, end_date=tomorrow)
+        self.assertGreater(created.id, max(polls.values_list('id', flat=True)))
+
+    def test_active_polls_date(self):
+        day_before_yesterday = datetime.date.today() - datetime.timedelta(days=2)
+        with mock.patch('api.views.timezone.localdate', return_value=day_before_yesterday):
+            r = self.client.get(reverse('poll-list'))
+        self.assertEqual([p['id'] for p in r.data['results']], [1, 2])
+        r = self.client.get(reverse('poll-list'))
+        self.assertEqual([p['id'] for p in r.data['results']], [1])
+
+    def test_poll_cache(self):
+        self.login()
+        r = self.client.get(reverse('poll-list'))
+        self.assertEqual(r.data['results'], self.get_poll_result)
+        with self.assertNumQueries(0):
+            r = self.client.get(reverse('poll-list'))
+        self.assertEqual(r.data['results'], self.get_poll_result)
+        self.client.patch(reverse('poll-detail', args=(1,)), {'name': 'renamed'})
+        r = self.client.get(reverse('poll-list'))
+        self.assertEqual(r.data['results'][0]['name'], 'renamed')
+        r = self.client.get(reverse('cache-stats'))
+        # revision and response lookups of every request
+        self.assertEqual((r.data['hits'], r.data['misses']), (2, 4))
+
+    def test_conditional_get(self):
+        self.login()
+        for url in (reverse('poll-list'), reverse('poll-detail', args=(1,)), reverse('poll-question-list', args=(1,))):
+            r = self.client.get(url)
+            etag, last_modified = r['ETag'], r['Last-Modified']
+            with self.assertNumQueries(0):
+                r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(r.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual((r['ETag'], r.content), (etag, b''))
+            r = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(r.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.patch(reverse('poll-question-detail', args=(1, 1)), {'text': 'changed'})
+        r = self.client.get(reverse('poll-question-list', args=(1,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(r['ETag'], etag)
+        r = self.client.get(reverse('poll-detail', args=('x',)))
+        self.assertEqual(r.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_token_revoke(self):
+        self.login()
+        r = self.client.post(reverse('poll-list'), self.create_poll_input)
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        AccessToken.objects.get(token=self.access_token.token).revoke()
+        r = self.client.post(reverse('poll-list'), self.create_poll_input)
+        self.assertEqual(r.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class QuestionViewSetTestCase(ApiUserTestClient):
 
@@ -320,6 +480,79 @@ class QuestionViewSetTestCase(ApiUserTestClient):
         self.assertEqual(r.status_code, status.HTTP_200_OK)
         self.assertEqual(r.data, self.edite_choise_question_output)
 
+    def test_question_cache_invalidation(self):
+        self.login()
+        self.client.get(reverse('poll-question-list', args=(1,)))
+        self.client.patch(reverse('poll-question-detail', args=(1, 2)),
+                          data=self.edite_choise_question,
+                          format='json')
+        r = self.client.get(reverse('poll-question-list', args=(1,)))
+        self.assertEqual(r.data['results'][1], self.edite_choise_question_output)
+        self.client.delete(reverse('poll-question-detail', args=(1, 2)))
+        r = self.client.get(reverse('poll-question-list', args=(1,)))
+        self.assertEqual([q['id'] for q in r.data['results']], [1, 3])
+
+    def test_poll_snapshot(self):
+        url = reverse('poll-snapshot', args=(1,))
+        r = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual((r.status_code, r['Content-Encoding']), (200, 'gzip'))
+        self.assertIn('Accept-Encoding', r['Vary'])
+        snapshot = json.loads(gzip.decompress(r.content))
+        self.assertEqual(snapshot['name'], 'test_poll')
+        self.assertEqual(snapshot['questions'], self.get_question_output)
+        with self.assertNumQueries(0):
+            r = self.client.get(url)
+        self.assertFalse(r.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(r.content), snapshot)
+        r = self.client.get(url, HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(r.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.login()
+        self.client.patch(reverse('poll-question-detail', args=(1, 1)), {'text': 'changed'})
+        r = self.client.get(url)
+        self.assertEqual(json.loads(r.content)['questions'][0]['text'], 'changed')
+        for pk in (3, 'x'):
+            r = self.client.get(reverse('poll-snapshot', args=(pk,)))
+            self.assertEqual(r.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(preferred_encoding('br;q=1, gzip;q=0.5', {'gzip': None, 'br': None}), 'br')
+        self.assertEqual(preferred_encoding('gzip;q=0, *', {'gzip': None}), 'identity')
+
+    def test_values_serializers(self):
+        r = self.client.post(reverse('answer-list'), {'user_id': 1, 'poll': 1, 'answers': [
+            {'question': 1, 'answer': 'text \u2028 answer'}, {'question': 2, 'answer_id': 1}]}, format='json')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        Poll.objects.filter(id=2).update(start_date=None)
+        # deleted options are left out by both serializers
+        deleted = Question.answer.through.objects.exclude(answeroptions_id=1).values_list('answeroptions_id', flat=True)
+        AnswerOptions.objects.filter(id=deleted.first()).soft_delete()
+        for queryset, model_serializer, values_serializer in (
+                (Poll.objects.order_by('id'), PollSerializer, PollValuesSerializer),
+                (Question.objects.order_by('id'), QuestionSerializer, QuestionValuesSerializer),
+                (UserPollAnswer.objects.order_by('id'), UserPollAnswerSerializer, UserPollAnswerValuesSerializer)):
+            expected = JSONRenderer().render(model_serializer(queryset, many=True).data)
+            self.assertEqual(FastJSONRenderer().render(values_serializer(values_serializer.values(queryset),
+                                                                         many=True).data), expected)
+            self.assertEqual(values_serializer(values_serializer.values(queryset).first()).data,
+                             model_serializer(queryset.first()).data)
+
+    def test_answer_type_registry(self):
+        answer_types.get('text')
+        with self.assertNumQueries(0):
+            serializer = QuestionSerializer(data=self.create_choise_question)
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['answer_type'], AnswerType.objects.get(type='choise'))
+        AnswerType.objects.create(type='scale')
+        serializer = QuestionSerializer(data=dict(self.create_text_question, answer_type='scale'))
+        self.assertTrue(serializer.is_valid())
+        # rows added without signals, as by another process, are found on a miss
+        AnswerType.objects.bulk_create([AnswerType(type='rating')])
+        self.assertEqual(answer_types.get('rating'), AnswerType.objects.get(type='rating'))
+        AnswerType.objects.bulk_create([AnswerType(type='stars')])
+        self.assertEqual(answer_types.name_of(AnswerType.objects.get(type='stars').id), 'stars')
+        with self.assertNumQueries(0):
+            self.assertEqual(answer_types.name_of(answer_types.id_of('rating')), 'rating')
+        with self.assertNumQueries(1):
+            self.assertIsNone(answer_types.get('unknown'))
+
     def test_text_question_with_answer_error(self):
         self.login()
         r = self.client.post(reverse('poll-question-list', args=(1,)),
@@ -457,6 +690,33 @@ class UserPollAnswerViewSetTestCase(ApiUserTestClient):
             "Empty param user_id"
         ]
 
+        self.poll_results = {
+            "poll": 1,
+            "responses": 2,
+            "questions": [
+                {"id": 1, "text": "question with text answer", "answer_type": "text", "responses": 2,
+                 "text_answers": 2},
+                {"id": 2, "text": "question with single choise", "answer_type": "choise", "responses": 2,
+                 "answers": [{"id": 1, "text": "choise1", "count": 2}, {"id": 2, "text": "choise2", "count": 0}]},
+                {"id": 3, "text": "question with multi choise", "answer_type": "choise_multi", "responses": 2,
+                 "answers": [{"id": 1, "text": "choise1", "count": 2}, {"id": 2, "text": "choise2", "count": 2}]},
+            ]
+        }
+
+        self.poll_answer_wrong_poll = {
+            "user_id": 1,
+            "poll": 100,
+            "answers": [
+                {"question": 1, "answer": "text_answer"},
+            ]
+        }
+
+        self.poll_answer_wrong_poll_error = {
+            "non_field_errors": [
+                "Poll id:100 does not exist"
+            ]
+        }
+
     def test_allowed_method(self):
         response = self.client.post(reverse('answer-list'),
                                     data=self.poll_answer,
@@ -519,6 +779,7 @@ class UserPollAnswerViewSetTestCase(ApiUserTestClient):
                              format='json')
         self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(r.data, self.answer_multichoise_error)
+        self.assertFalse(UserPollAnswer.objects.exists())
 
     def test_get_answer(self):
         r = self.client.post(reverse('answer-list'),
@@ -533,3 +794,475 @@ class UserPollAnswerViewSetTestCase(ApiUserTestClient):
         r = self.client.get(reverse('answer-list'))
         self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(r.data, self.empty_user_id_error)
+
+    def test_answer_to_wrong_poll(self):
+        r = self.client.post(reverse('answer-list'),
+                             data=self.poll_answer_wrong_poll,
+                             format='json')
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(r.data, self.poll_answer_wrong_poll_error)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_answer_history_indexes(self):
+        plan = UserPollAnswer.objects.filter(user_id=1).order_by('id').explain()
+        self.assertIn('USING INDEX user_live_answer_history_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = UserPollQuestionAnswer.objects.filter(user_poll_id=1, question_id=1).explain()
+        self.assertIn('USING INDEX live_user_poll_question_idx', plan)
+
+    def test_validate_query_count(self):
+        answer_types.get('text')
+        for answers_count in (1, len(self.poll_answer['answers'])):
+            data = dict(self.poll_answer, answers=self.poll_answer['answers'][:answers_count])
+            serializer = UserPollAnswerSerializer(data=data)
+            # poll tree and the indexed lookup of a live submission of the user to the poll
+            with self.assertNumQueries(4):
+                self.assertTrue(serializer.is_valid())
+
+    def test_create_query_count(self):
+        serializer = UserPollAnswerSerializer(data=self.poll_answer)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        queries = []
+        for answers_count in (1, len(self.poll_answer['answers'])):
+            data = dict(self.poll_answer, user_id=1 + answers_count, answers=self.poll_answer['answers'][:answers_count])
+            serializer = UserPollAnswerSerializer(data=data)
+            self.assertTrue(serializer.is_valid())
+            with CaptureQueriesContext(connection) as ctx:
+                serializer.save()
+            queries.append(len(ctx))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_batch_answer(self):
+        data = [self.poll_answer,
+                self.poll_answer_wrong_question,
+                dict(self.poll_answer, user_id=2),
+                dict(self.answer_choise_question_multiple_answer, user_id=3)]
+        r = self.client.post(reverse('answer-batch'), data=data, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data['created'], 2)
+        self.assertEqual(r.data['failed'], 2)
+        self.assertEqual([i['status'] for i in r.data['results']], [201, 400, 201, 400])
+        self.assertEqual(r.data['results'][1]['errors'], self.poll_answer_wrong_question_error)
+        self.assertEqual(r.data['results'][3]['errors'], self.answer_multichoise_error)
+        db = UserPollAnswer.objects.get(id=r.data['results'][2]['id'])
+        self.assertEqual(UserPollAnswerSerializer(db).data, dict(self.poll_answer_output, user_id=2))
+
+    def test_batch_answer_not_list(self):
+        r = self.client.post(reverse('answer-batch'), data=self.poll_answer, format='json')
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_queue_ingest(self):
+        with tempfile.TemporaryDirectory() as path, \
+                override_settings(ANSWER_INGEST_MODE='queue', ANSWER_QUEUE_PATH=f'{path}/queue.sqlite3'):
+            r = self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+            self.assertEqual(r.status_code, status.HTTP_202_ACCEPTED)
+            with self.assertNumQueries(0):
+                r = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, user_id=2), format='json')
+            self.assertEqual(r.status_code, status.HTTP_202_ACCEPTED)
+            r = self.client.post(reverse('answer-list'), data=self.poll_answer_wrong_question, format='json')
+            self.assertEqual(r.data, self.poll_answer_wrong_question_error)
+            r = self.client.post(reverse('answer-list'), data=self.answer_choise_question_multiple_answer, format='json')
+            self.assertEqual(r.data, self.answer_multichoise_error)
+            self.assertEqual(UserPollAnswer.objects.count(), 0)
+            self.assertEqual(self.client.get(reverse('answer-queue')).data['depth'], 2)
+            call_command('drain_answers', '--once', stdout=StringIO())
+            r = self.client.get(reverse('answer-queue'))
+            self.assertEqual((r.data['depth'], r.data['flushed_submissions']), (0, 2))
+            db = UserPollAnswer.objects.get(user_id=2)
+            self.assertEqual(UserPollAnswerSerializer(db).data, dict(self.poll_answer_output, user_id=2))
+            # batches and keyed retries go through the queue as well
+            r = self.client.post(reverse('answer-batch'), data=[dict(self.poll_answer, user_id=3),
+                                                                self.poll_answer_wrong_question], format='json')
+            self.assertEqual((r.status_code, r.data['queued'], r.data['failed']), (status.HTTP_202_ACCEPTED, 1, 1))
+            for _ in range(2):
+                r = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, user_id=4), format='json',
+                                     HTTP_IDEMPOTENCY_KEY='queued')
+                self.assertEqual(r.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(self.client.get(reverse('answer-queue')).data['depth'], 2)
+            r = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, user_id=5), format='json',
+                                 HTTP_IDEMPOTENCY_KEY='queued')
+            self.assertEqual(r.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+            # user 3 answers directly after the drainer looked for duplicates
+            direct = UserPollAnswerSerializer(data=dict(self.poll_answer, user_id=3))
+            direct.is_valid(raise_exception=True)
+            direct.save()
+            lookups = []
+
+            def stale_lookup(submissions):
+                lookups.append(submissions)
+                return (submissions, []) if len(lookups) == 1 else without_duplicates(submissions)
+
+            with mock.patch('api.ingest_queue.without_duplicates', side_effect=stale_lookup):
+                call_command('drain_answers', '--once', stdout=StringIO())
+            self.assertEqual(len(lookups), 2)
+            self.assertEqual(sorted(UserPollAnswer.objects.values_list('user_id', flat=True)), [1, 2, 3, 4])
+
+    def test_duplicate_answer(self):
+        r = self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        r = self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(r.data, {'non_field_errors': ['User id:1 already answered poll id:1']})
+        r = self.client.post(reverse('answer-batch'), data=[self.poll_answer, dict(self.poll_answer, user_id=2),
+                                                            dict(self.poll_answer, user_id=2)], format='json')
+        self.assertEqual([i['status'] for i in r.data['results']], [400, 201, 400])
+        self.assertEqual(UserPollAnswer.objects.filter(isdelete=False).count(), 2)
+
+    def test_replace_answer(self):
+        self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        answers = [{'question': 1, 'answer': 'changed'}, {'question': 2, 'answer_id': 1}]
+        with override_settings(ANSWER_SUBMISSION_POLICY='replace'):
+            r = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, answers=answers), format='json')
+            self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+            r = self.client.post(reverse('answer-batch'), data=[self.poll_answer, dict(self.poll_answer, answers=answers)],
+                                 format='json')
+        self.assertEqual(r.data['results'][0]['id'], r.data['results'][1]['id'])
+        r = self.client.get(reverse('answer-list'), {'user_id': 1})
+        self.assertEqual(r.data['count'], 1)
+        self.assertEqual(r.data['results'][0]['answers'][0]['answer'], 'changed')
+        r = self.client.get(reverse('poll-results', args=(1,)))
+        self.assertEqual(r.data['responses'], 1)
+        call_command('rebuild_tallies', '--verify-only', stdout=StringIO())
+
+    def test_idempotency_key(self):
+        r = self.client.post(reverse('answer-list'), data=self.poll_answer, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(1):
+            retry = self.client.post(reverse('answer-list'), data=self.poll_answer, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((retry.status_code, retry.data), (r.status_code, r.data))
+        self.assertEqual(UserPollAnswer.objects.count(), 1)
+        other = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, user_id=2), format='json',
+                                 HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(other.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(UserPollAnswer.objects.filter(user_id=2).exists())
+        # an expired key is used again
+        IdempotencyKey.objects.update(created=timezone.now() - datetime.timedelta(hours=25))
+        other = self.client.post(reverse('answer-list'), data=dict(self.poll_answer, user_id=2), format='json',
+                                 HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(other.status_code, status.HTTP_201_CREATED)
+        IdempotencyKey.objects.update(created=timezone.now() - datetime.timedelta(hours=25))
+        out = StringIO()
+        call_command('expire_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 expired', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_purge_deleted(self):
+        self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        with override_settings(ANSWER_SUBMISSION_POLICY='replace'):
+            self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        self.login()
+        self.client.delete(reverse('poll-detail', args=(1,)))
+        Poll.objects.filter(id=2).soft_delete()
+        self.assertEqual((Poll.objects.count(), Poll.all_objects.count()), (0, 2))
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertFalse(ArchivedRow.objects.exists())
+        out = StringIO()
+        call_command('purge_deleted', '--days', '0', '--batch-size', '1', stdout=out)
+        self.assertIn('Archived 6 rows', out.getvalue())
+        archived = ArchivedRow.objects.values_list('table', 'row_id')
+        self.assertEqual(sorted(archived), [('api_poll', 2), ('api_userpollanswer', 1)] +
+                         [('api_userpollquestionanswer', i) for i in range(1, 5)])
+        # the poll with a live submission stays
+        self.assertEqual(list(Poll.all_objects.values_list('id', flat=True)), [1])
+        self.assertEqual(UserPollQuestionAnswer.objects.count(), 4)
+        poll = next(serializers.deserialize('python', [json.loads(ArchivedRow.objects.get(table='api_poll').data)]))
+        self.assertEqual((poll.object.id, poll.object.name, poll.m2m_data['question']), (2, 'test_past_poll', []))
+        call_command('rebuild_tallies', '--verify-only', stdout=out)
+
+    def test_poll_results(self):
+        self.client.post(reverse('answer-list'), data=self.poll_answer, format='json')
+        self.client.post(reverse('answer-batch'), data=[dict(self.poll_answer, user_id=2)], format='json')
+        r = self.client.get(reverse('poll-results', args=(1,)))
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data, self.poll_results)
+        out = StringIO()
+        call_command('rebuild_tallies', '--verify-only', stdout=out)
+        self.assertIn('tallies verified', out.getvalue())
+        call_command('rebuild_tallies', stdout=out)
+        r = self.client.get(reverse('poll-results', args=(1,)))
+        self.assertEqual(r.data, self.poll_results)
+        self.assertEqual(self.client.get(reverse('poll-results', args=('abc',))).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tally_upsert(self):
+        key = (1, None, None)
+        add_to_tallies(Counter({key: 1}))
+        reads = []
+
+        def stale_tally_ids(keys):
+            # the first read misses the row as a concurrent transaction would
+            reads.append(keys)
+            return {} if len(reads) == 1 else tally_ids(keys)
+
+        with mock.patch('api.tallies.tally_ids', side_effect=stale_tally_ids):
+            add_to_tallies(Counter({key: 2}))
+        self.assertEqual(list(AnswerTally.objects.values_list('poll_id', 'count')), [(1, 3)])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AnswerTally.objects.create(poll_id=1)
+
+    def user_answers_to_poll_copies(self, count):
+        """
+        Answers of user 1 to count - 1 copies of poll 1 and to poll 1 itself
+        """
+        poll = Poll.objects.get(id=1)
+        Poll.objects.bulk_create([Poll(name=f'copy {i}', start_date=poll.start_date, end_date=poll.end_date)
+                                  for i in range(count - 1)])
+        copies = Poll.objects.filter(name__startswith='copy ').order_by('id')
+        Poll.question.through.objects.bulk_create([Poll.question.through(poll_id=c.id, question_id=q.id)
+                                                   for c in copies for q in poll.question.all()])
+        return [dict(self.poll_answer, poll=c.id) for c in copies] + [self.poll_answer]
+
+    def test_get_answer_query_count(self):
+        r = self.client.post(reverse('answer-batch'), data=self.user_answers_to_poll_copies(100), format='json')
+        self.assertEqual(r.data['created'], 100)
+        with self.assertNumQueries(3):
+            r = self.client.get(reverse('answer-list'), {'user_id': 1})
+        self.assertEqual(len(r.data['results']), 100)
+        self.assertEqual(r.data['results'][-1], self.user_answer['results'][0])
+
+    def test_request_metrics(self):
+        self.client.post(reverse('answer-batch'), data=self.user_answers_to_poll_copies(3), format='json')
+        with override_settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('api.metrics') as logs:
+            self.client.get(reverse('answer-list'), {'user_id': 1})
+        self.assertIn('3 queries', logs.output[0])
+        self.assertIn('FROM "api_userpollanswer"', logs.output[0])
+        counts, count, total = REQUEST_QUERIES.samples((('view', 'answer-list'), ('method', 'GET')))
+        self.assertEqual((count, total), (1, 3))
+        r = self.client.get(reverse('metrics'))
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertIn('polls_request_queries_bucket{view="answer-list",method="GET",le="3"} 1', r.content.decode())
+        self.assertIn('polls_request_duration_seconds_count{view="answer-batch",method="POST"} 1',
+                      r.content.decode())
+
+    def test_get_answer_keyset_pagination(self):
+        self.client.post(reverse('answer-batch'), data=self.user_answers_to_poll_copies(3), format='json')
+        with mock.patch.object(KeysetPagination, 'page_size', 2):
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.get(reverse('answer-list'), {'user_id': 1, 'pagination': 'cursor'})
+            self.assertNotIn('COUNT(', ' '.join(q['sql'] for q in ctx.captured_queries))
+            self.assertNotIn('count', r.data)
+            self.assertEqual(len(r.data['results']), 2)
+            self.assertIsNone(r.data['previous'])
+            r = self.client.get(r.data['next'])
+            self.assertEqual(len(r.data['results']), 1)
+            self.assertIsNone(r.data['next'])
+            self.assertEqual(r.data['results'][0], self.user_answer['results'][0])
+
+    def test_export_answers(self):
+        self.client.post(reverse('answer-batch'), data=[self.poll_answer, dict(self.poll_answer, user_id=2)],
+                         format='json')
+        r = self.client.get(reverse('poll-export', args=(1,)))
+        self.assertEqual(r.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.login()
+        r = self.client.get(reverse('poll-export', args=(1,)))
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('poll-export', args=('abc',))).status_code, status.HTTP_404_NOT_FOUND)
+        # export order is unspecified, rows are compared as a multiset
+        header, *lines = b''.join(r.streaming_content).decode().splitlines()
+        self.assertEqual(header, 'user_poll,user_id,question,answer,answer_id')
+        self.assertEqual(len(lines), 8)
+        self.assertTrue({'1,1,1,text_answer,', '1,1,2,,1'} <= set(lines))
+        r = self.client.get(reverse('poll-export', args=(1,)), {'export_format': 'ndjson'})
+        rows = sorted(b''.join(r.streaming_content).decode().splitlines())
+        self.assertIn({'user_poll': 2, 'user_id': 2, 'question': 3, 'answer': '', 'answer_id': 2},
+                      [json.loads(line) for line in rows])
+        out = StringIO()
+        call_command('export_answers', '1', '--format', 'ndjson', stdout=out)
+        self.assertEqual(sorted(out.getvalue().splitlines()), rows)
+
+    def test_archive_answers(self):
+        self.client.post(reverse('answer-batch'), data=[self.poll_answer, dict(self.poll_answer, user_id=2)],
+                         format='json')
+        history = self.client.get(reverse('answer-list'), {'user_id': 1}).data
+        export = StringIO()
+        call_command('export_answers', '1', stdout=export)
+        with tempfile.TemporaryDirectory() as path, override_settings(ANSWER_ARCHIVE_DIR=path):
+            out = StringIO()
+            call_command('archive_answers', stdout=out)
+            self.assertIn('Archived answers of 0 submissions', out.getvalue())
+            Poll.objects.filter(id=1).update(end_date=datetime.date.today() - datetime.timedelta(days=91))
+            # a run stopped after writing the archive file leaves the hot rows to the next run
+            with mock.patch('api.answer_archive.transaction.atomic', side_effect=OperationalError):
+                with self.assertRaises(OperationalError):
+                    call_command('archive_answers', stdout=out)
+            self.assertEqual(UserPollQuestionAnswer.objects.count(), 8)
+            call_command('archive_answers', '--chunk-size', '1', stdout=out)
+            self.assertIn('Archived answers of 2 submissions', out.getvalue())
+            self.assertEqual((UserPollQuestionAnswer.all_objects.count(), UserPollAnswer.objects.count()), (0, 2))
+            with sqlite3.connect(f'{path}/poll_1.sqlite3') as conn:
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM answers').fetchone(), (8,))
+            self.assertEqual(self.client.get(reverse('answer-list'), {'user_id': 1}).data, history)
+            for chunk_size in ('1', '2000'):
+                archived = StringIO()
+                call_command('export_answers', '1', '--chunk-size', chunk_size, stdout=archived)
+                self.assertEqual(sorted(archived.getvalue().splitlines()), sorted(export.getvalue().splitlines()))
+            call_command('rebuild_tallies', '--verify-only', stdout=out)
+            self.assertIn('tallies verified', out.getvalue())
+            call_command('rebuild_tallies', stdout=out)
+            self.assertEqual(self.client.get(reverse('poll-results', args=(1,))).data, self.poll_results)
+            retire_submissions([2])
+            out = StringIO()
+            call_command('rebuild_tallies', '--verify-only', stdout=out)
+            self.assertIn('tallies verified', out.getvalue())
+            os.remove(f'{path}/poll_1.sqlite3')
+            r = self.client.get(reverse('answer-list'), {'user_id': 1})
+            self.assertEqual(r.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.login()
+            r = self.client.get(reverse('poll-export', args=(1,)))
+            self.assertEqual(r.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class DuplicateSubmissionRaceTestCase(TransactionTestCase):
+    serialized_rollback = True
+
+    def test_concurrent_submissions(self):
+        """
+        Writers compete on a WAL database file with the duplicate lookup switched off,
+        the one_live_answer_per_user_poll constraint alone keeps one submission
+        """
+        poll = Poll.objects.create(name='race', start_date=yesterday, end_date=tomorrow)
+        question = Question.objects.create(text='text', answer_type=AnswerType.objects.get(id=1))
+        poll.question.add(question)
+        data = {'user_id': 1, 'poll': poll.id, 'answers': [{'question': question.id, 'answer': 'race'}]}
+        barrier = threading.Barrier(4)
+        outcomes = []
+
+        def submit():
+            barrier.wait()
+            try:
+                serializer = UserPollAnswerSerializer(data=data)
+                try:
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    outcomes.append('created')
+                except ValidationError:
+                    outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        with tempfile.TemporaryDirectory() as path:
+            name = f'{path}/db.sqlite3'
+            target = sqlite3.connect(name)
+            connection.ensure_connection()
+            connection.connection.backup(target)
+            target.close()
+            database = dict(connection.settings_dict, ENGINE='api.backends.sqlite3', NAME=name,
+                            OPTIONS={'pragmas': settings.SQLITE_WAL_PRAGMAS})
+            # threads open their connections to the database file
+            with mock.patch.dict(connections.databases, {DEFAULT_DB_ALIAS: database}), \
+                    mock.patch('api.serializers.live_submissions', return_value={}):
+                threads = [threading.Thread(target=submit) for _ in range(barrier.parties)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            with sqlite3.connect(name) as db:
+                stored = db.execute('SELECT COUNT(*) FROM api_userpollanswer WHERE poll_id = ?', (poll.id,)).fetchone()
+        self.assertEqual(sorted(outcomes), ['created'] + ['rejected'] * (barrier.parties - 1))
+        self.assertEqual(stored, (1,))
+        polls_cache().clear()
+        answer_types.reset()
+
+
+class ASGIExportTestCase(TransactionTestCase):
+    serialized_rollback = True
+
+    def test_streaming_export(self):
+        """
+        Hot and archived answers stream through the ASGI handler as through WSGI
+        """
+        user = User.objects.create(username='export@test.com')
+        application = Application.objects.create(name='export', user=user, client_type=Application.CLIENT_CONFIDENTIAL,
+                                                 authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE)
+        AccessToken.objects.create(user=user, token='export-token', application=application, scope='read write',
+                                   expires=timezone.now() + datetime.timedelta(seconds=300))
+        poll = Poll.objects.create(name='export', start_date=yesterday, end_date=tomorrow)
+        question = Question.objects.create(text='text', answer_type=AnswerType.objects.get(id=1))
+        poll.question.add(question)
+        client = APIClient()
+        for user_id in range(1, 4):
+            client.post(reverse('answer-list'), format='json', data={
+                'user_id': user_id, 'poll': poll.id, 'answers': [{'question': question.id, 'answer': f'a{user_id}'}]})
+        url = reverse('poll-export', args=(poll.id,))
+        client.credentials(HTTP_AUTHORIZATION='Bearer export-token')
+        expected = sorted(b''.join(client.get(url).streaming_content).splitlines())
+        self.assertEqual(len(expected), 4)
+        app = get_asgi_application()
+        headers = [(b'authorization', b'Bearer export-token')]
+        with tempfile.TemporaryDirectory() as path, override_settings(ANSWER_ARCHIVE_DIR=path):
+            for archive in (False, True):
+                if archive:
+                    Poll.objects.filter(id=poll.id).update(end_date=datetime.date.today() - datetime.timedelta(days=91))
+                    call_command('archive_answers', '--chunk-size', '2', stdout=StringIO())
+                status_code, body = asyncio.run(asgi_request(app, 'GET', url, headers=headers))
+                self.assertEqual((status_code, sorted(body.splitlines())), (200, expected))
+        polls_cache().clear()
+        answer_types.reset()
+        token_cache.clear()
+
+
+class GunicornConfigTestCase(SimpleTestCase):
+    def test_shared_polls_cache(self):
+        path = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '3'}):
+            os.environ.pop('POLLS_CACHE_BACKEND', None)
+            runpy.run_path(path)
+            self.assertEqual(os.environ['POLLS_CACHE_BACKEND'], 'file')
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '3', 'POLLS_CACHE_BACKEND': 'locmem'}):
+            with self.assertRaises(RuntimeError):
+                runpy.run_path(path)
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '1', 'POLLS_CACHE_BACKEND': 'locmem'}):
+            self.assertEqual(runpy.run_path(path)['workers'], 1)
+
+
+class FastJSONTestCase(SimpleTestCase):
+    def test_renderer_output(self):
+        data = {'text': 'юникод \u2028\u2029', 1: [None, True, 1.5, 2 ** 40], 'decimal': decimal.Decimal('1.10'),
+                'date': datetime.date(2020, 5, 12), 'time': datetime.datetime(2020, 5, 12, 17, 1, 2, 345678,
+                                                                              tzinfo=datetime.timezone.utc)}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_parser(self):
+        body = json.dumps({'user_id': 1, 'answers': [{'answer': 'юникод'}]}, ensure_ascii=False).encode()
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"user_id": NaN}'))
+
+
+class SqliteBackendTestCase(SimpleTestCase):
+    def test_pragmas_and_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as path:
+            name = f'{path}/db.sqlite3'
+            db = DatabaseWrapper(dict(connection.settings_dict, NAME=name,
+                                      OPTIONS={'pragmas': settings.SQLITE_WAL_PRAGMAS}), 'tuned')
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], settings.SQLITE_WAL_PRAGMAS['busy_timeout'])
+                db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                other = sqlite3.connect(name, timeout=0, isolation_level=None)
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute('BEGIN IMMEDIATE')
+                other.close()
+                db.rollback()
+                db.set_autocommit(True)
+            finally:
+                db.close()
+
+
+class BenchmarkCompareTestCase(SimpleTestCase):
+    def test_compare_results(self):
+        baseline = {'hot_paths': {'submit': {'queries_per_call': 9, 'p50_ms': 30, 'p99_ms': 100, 'rps': 30}}}
+        same = {'hot_paths': {'submit': {'queries_per_call': 9, 'p50_ms': 33, 'p99_ms': 300, 'rps': 27}}}
+        self.assertEqual(compare_results(baseline, same, 0.25), [])
+        worse = {'hot_paths': {'submit': {'queries_per_call': 10, 'p50_ms': 40, 'p99_ms': 100, 'rps': 20}}}
+        self.assertEqual([r.split(':')[0] for r in compare_results(baseline, worse, 0.25)],
+                         ['hot_paths.submit.queries_per_call', 'hot_paths.submit.p50_ms', 'hot_paths.submit.rps'])
+        failing = {'concurrency': {'sqlite': {'rps': 30, 'errors': 0}, 'sqlite-wal': {'rps': 300, 'errors': 40}}}
+        self.assertEqual(compare_results({'concurrency': {'sqlite': {'rps': 30}}}, failing, 0.25),
+                         ['concurrency.sqlite-wal.errors: 40 failed requests'])
@@ -1,14 +1,15 @@
 from django.urls import path, include
 from rest_framework_nested import routers
-from .views import PollViewSet, QuestionViewSet, UserPollAnswerViewSet
+from .views import PollViewSet, QuestionViewSet, UserPollAnswerViewSet, CacheStatsView
 
 api_v1 = routers.DefaultRouter()
-api_v1.register('poll', PollViewSet)
+api_v1.register('poll', PollViewSet, basename='poll')
 api_v1.register('answer', UserPollAnswerViewSet, basename='answer')
 question_router = routers.NestedDefaultRouter(api_v1, 'poll', lookup='poll')
 question_router.register('question', QuestionViewSet, basename='poll-question')
 urlpatterns = [
     path('v1/', include(api_v1.urls)),
     path('v1/', include(question_router.urls)),
+    path('v1/cache/', CacheStatsView.as_view(), name='cache-stats'),
     path('auth/', include('oauth2_provider.urls', namespace='oauth2_provider')),
 ]
\ No newline at end of file
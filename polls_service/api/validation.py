@@ -0,0 +1,127 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+from .answer_types import answer_types
+from .cache import cached, poll_scope
+from .models import Poll, Question
+
+
+def poll_tree_queryset():
+    """
+    Live polls with their live questions and answer options prefetched
+    """
+    questions = Question.objects.prefetch_related('answer')
+    return Poll.objects.prefetch_related(Prefetch('question', queryset=questions))
+
+
+def to_poll_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError(f"Wrong poll id: {value}")
+
+
+def submitted_poll_ids(submissions):
+    """
+    Poll ids of raw submissions, malformed ones are left for the serializer to report
+    """
+    poll_ids = set()
+    for item in submissions:
+        try:
+            poll_ids.add(int(item['poll']))
+        except (TypeError, ValueError, KeyError):
+            pass
+    return poll_ids
+
+
+def submitted_user_polls(submissions):
+    """
+    (user_id, poll_id) pairs of raw submissions, malformed ones are left for the serializer to report
+    """
+    pairs = set()
+    for item in submissions:
+        try:
+            pairs.add((int(item['user_id']), int(item['poll'])))
+        except (TypeError, ValueError, KeyError):
+            pass
+    return pairs
+
+
+def answered_error(user_id, poll_id):
+    return serializers.ValidationError(f"User id:{user_id} already answered poll id:{poll_id}")
+
+
+class PollAnswerValidator:
+    """
+    In-memory view of a poll for answer validation.
+
+    The poll, its live questions and allowed answer options are loaded with a fixed
+    number of queries, answer types come from the answer type registry. After that
+    every submitted answer is checked against in-memory sets.
+    """
+
+    def __init__(self, poll):
+        self.poll = poll
+        self.questions = {q.id: q for q in poll.question.all()}
+        self.allowed_answers = {q.id: {a.id for a in q.answer.all()} for q in self.questions.values()}
+
+    @classmethod
+    def for_poll(cls, poll_id):
+        poll_id = to_poll_id(poll_id)
+        try:
+            return cls(poll_tree_queryset().get(id=poll_id))
+        except Poll.DoesNotExist:
+            raise serializers.ValidationError(f"Poll id:{poll_id} does not exist")
+
+    @classmethod
+    def for_polls(cls, poll_ids):
+        """
+        Load validators for several polls with the same fixed number of queries
+        """
+        return {p.id: cls(p) for p in poll_tree_queryset().filter(id__in=poll_ids)}
+
+    def validate(self, answers):
+        """
+        Check answers given as raw question_id and answer_id_id values
+        """
+        text_id = answer_types.id_of('text')
+        choise_ids = answer_types.ids_of('choise', 'choise_multi')
+        for vq in answers:
+            question_id = vq['question_id']
+            if question_id not in self.questions:
+                raise serializers.ValidationError(f"Question id:{question_id} not in poll id: {self.poll.id}")
+            answer_type_id = self.questions[question_id].answer_type_id
+            if answer_type_id == text_id and not vq.get('answer'):
+                raise serializers.ValidationError(f"Question id:{question_id} type text requires answer field")
+            if answer_type_id in choise_ids and not vq.get('answer_id_id'):
+                answer_type = answer_types.name_of(answer_type_id)
+                raise serializers.ValidationError(f"Question id:{question_id} type {answer_type} requires answer_id field")
+            if vq.get('answer_id_id') and vq['answer_id_id'] not in self.allowed_answers[question_id]:
+                raise serializers.ValidationError(f"Answer id:{vq['answer_id_id']}, not allowed for question "
+                                                  f"id:{question_id}")
+        return answers
+
+    def check_single_answers(self, answers):
+        """
+        Only choise_multi questions can be answered more than once in one submission
+        """
+        single_ids = answer_types.ids_of('text', 'choise')
+        answered = set()
+        for a in answers:
+            question_id = a['question_id']
+            if self.questions[question_id].answer_type_id in single_ids and question_id in answered:
+                raise serializers.ValidationError("Multiple answers are possible only to choise_multi question")
+            answered.add(question_id)
+
+
+def cached_poll_validators(poll_ids):
+    """
+    Validators of existing polls from the polls cache, invalidated together with the poll
+    """
+    validators = {}
+    for poll_id in poll_ids:
+        try:
+            validators[poll_id] = cached(poll_scope(poll_id), 'answer-validator',
+                                         lambda: PollAnswerValidator.for_poll(poll_id))
+        except serializers.ValidationError:
+            pass
+    return validators
@@ -1,45 +1,377 @@
-from rest_framework import permissions, viewsets, mixins
-from rest_framework.viewsets import ModelViewSet
-from .models import Poll, Question, UserPollAnswer
-from .serializers import PollSerializer, QuestionSerializer, UserPollAnswerSerializer
 import datetime
+import functools
+import hashlib
+import json
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions, status, viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet
+from .cache import CATALOGUE, cached, invalidate_polls, invalidate_question, poll_scope, stats
+from .export import EXPORT_FORMATS, export_poll_answers
+from .models import IdempotencyKey, Poll, Question, UserPollAnswer, UserPollQuestionAnswer
+from .importer import import_polls
+from .ingest_queue import answer_queue, queued_submission
+from .serializers import PollSerializer, PollImportSerializer, PollValuesSerializer, QuestionSerializer, \
+    QuestionValuesSerializer, UserPollAnswerSerializer, UserPollAnswerValuesSerializer
+from .snapshot import poll_snapshot, preferred_encoding
+from .submissions import idempotency_keys, live_submissions, request_fingerprint, save_submissions, \
+    without_duplicates
+from .tallies import poll_results
+from .validation import PollAnswerValidator, answered_error, cached_poll_validators, submitted_poll_ids, \
+    submitted_user_polls
 from rest_framework import serializers
 
-today = datetime.datetime.now().strftime("%Y-%m-%d")
-
 
 # Create your views here.
 
 
-class PollViewSet(ModelViewSet):
-    queryset = Poll.objects.filter(isdelete=False, end_date__gt=today).order_by('id')
+class ValuesReadMixin:
+    """
+    List and retrieve GETs read values() rows with read_serializer_class, other
+    actions, browsable API forms and schemas use the model serializer
+    """
+    read_serializer_class = None
+
+    def reads_values(self):
+        return self.read_serializer_class is not None and self.action in ('list', 'retrieve') \
+            and self.request.method == 'GET' and not getattr(self, 'swagger_fake_view', False)
+
+    def get_serializer_class(self):
+        if self.reads_values():
+            return self.read_serializer_class
+        return super(ValuesReadMixin, self).get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        queryset = super(ValuesReadMixin, self).filter_queryset(queryset)
+        return self.read_serializer_class.values(queryset) if self.reads_values() else queryset
+
+
+class CachedReadMixin:
+    """
+    Read-through cache of list and retrieve responses with ETag and Last-Modified
+    validators, unchanged responses are answered with 304 before the body is built
+    """
+
+    def get_cache_scope(self):
+        raise NotImplementedError
+
+    def get_revision(self):
+        """
+        Timestamp of the last change of the response data, None when unknown
+        """
+        raise NotImplementedError
+
+    def cached_response(self, build):
+        today = timezone.localdate()
+        uri = self.request.build_absolute_uri()
+        revision = self.get_revision()
+        if revision is None:
+            return Response(cached(self.get_cache_scope(), f'{today}:{uri}', lambda: build().data))
+        etag = quote_etag(hashlib.md5(f'{revision}:{today}:{uri}:{self.request.accepted_renderer.format}'
+                                      .encode()).hexdigest())
+        # the set of active polls changes at midnight without any write
+        midnight = timezone.make_aware(datetime.datetime.combine(today, datetime.time())).timestamp()
+        last_modified = int(max(revision, midnight))
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(cached(self.get_cache_scope(), f'{today}:{uri}', lambda: build().data))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs))
+
+
+def poll_revision(poll_id=None):
+    """
+    Timestamp of the latest change of the poll, its questions or answer options, of all polls
+    without poll_id. Soft deleted polls count, removing a poll from the catalogue touches it.
+    """
+    polls = Poll.all_objects.all()
+    try:
+        if poll_id is not None:
+            polls = polls.filter(pk=poll_id)
+        modified = polls.aggregate(modified=Max('modified'))['modified']
+    except ValueError:
+        # malformed poll id, the view answers 404
+        return None
+    return modified.timestamp() if modified else None
+
+
+class PollViewSet(CachedReadMixin, ValuesReadMixin, ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     serializer_class = PollSerializer
+    read_serializer_class = PollValuesSerializer
+
+    def get_queryset(self):
+        return Poll.objects.filter(end_date__gt=timezone.localdate()).order_by('id')
+
+    def get_cache_scope(self):
+        return CATALOGUE if self.action == 'list' else poll_scope(self.kwargs['pk'])
+
+    def get_revision(self):
+        if self.action == 'list':
+            return cached(CATALOGUE, 'revision', poll_revision)
+        return cached(poll_scope(self.kwargs['pk']), 'revision', lambda: poll_revision(self.kwargs['pk']))
+
+    def perform_create(self, serializer):
+        super(PollViewSet, self).perform_create(serializer)
+        invalidate_polls([], catalogue=True)
+
+    def perform_update(self, serializer):
+        super(PollViewSet, self).perform_update(serializer)
+        invalidate_polls([serializer.instance.id], catalogue=True)
 
     def perform_destroy(self, instance):
-        instance.isdelete = True
-        instance.save(update_fields=['isdelete'])
+        instance.soft_delete()
+        invalidate_polls([instance.id], catalogue=True)
+
+    @action(detail=False, methods=['post'], url_path='import', serializer_class=PollImportSerializer)
+    def import_polls(self, request):
+        """
+        Create polls with their questions and answer options in bulk
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        polls = import_polls(serializer.validated_data)
+        invalidate_polls([], catalogue=True)
+        return Response(PollSerializer(polls, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True)
+    def results(self, request, pk=None):
+        """
+        Poll results from precomputed tallies, available for finished polls too
+        """
+        poll = get_object_or_404(Poll, pk=pk)
+        return Response(poll_results(poll))
 
+    @action(detail=True)
+    def snapshot(self, request, pk=None):
+        """
+        The poll with its questions, answer types and options as one precompiled JSON
+        document from the polls cache, br or gzip encoded when the client accepts it
+        """
+        try:
+            snapshot = poll_snapshot(int(pk))
+        except ValueError:
+            snapshot = None
+        if snapshot is None:
+            raise Http404
+        encoding = preferred_encoding(request.headers.get('Accept-Encoding', ''), snapshot)
+        etag, body = snapshot[encoding]
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
-class QuestionViewSet(ModelViewSet):
+    @action(detail=True, permission_classes=[permissions.IsAuthenticated])
+    def export(self, request, pk=None):
+        """
+        Stream all poll answers as csv, or as ndjson with ?export_format=ndjson
+        """
+        poll = get_object_or_404(Poll, pk=pk)
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise serializers.ValidationError(f"Wrong export_format, allowed: {', '.join(EXPORT_FORMATS)}")
+        response = StreamingHttpResponse(export_poll_answers(poll.id, export_format),
+                                         content_type=EXPORT_FORMATS[export_format][1])
+        response['Content-Disposition'] = f'attachment; filename="poll_{poll.id}_answers.{export_format}"'
+        return response
+
+
+class QuestionViewSet(CachedReadMixin, ValuesReadMixin, ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     serializer_class = QuestionSerializer
+    read_serializer_class = QuestionValuesSerializer
 
     def get_queryset(self):
         poll_id = self.request.parser_context['kwargs']['poll_pk']
-        return Question.objects.filter(isdelete=False, poll__id=poll_id).order_by('id')
+        return Question.objects.filter(poll__id=poll_id).order_by('id')
+
+    def get_cache_scope(self):
+        return poll_scope(self.kwargs['poll_pk'])
+
+    def get_revision(self):
+        return cached(poll_scope(self.kwargs['poll_pk']), 'revision', lambda: poll_revision(self.kwargs['poll_pk']))
 
     def perform_destroy(self, instance):
-        instance.isdelete = True
-        instance.save(update_fields=['isdelete'])
+        instance.soft_delete()
+        invalidate_question(instance)
 
 
-class UserPollAnswerViewSet(viewsets.GenericViewSet,
+class UserPollAnswerViewSet(ValuesReadMixin,
+                            viewsets.GenericViewSet,
                             mixins.CreateModelMixin,
                             mixins.ListModelMixin):
     serializer_class = UserPollAnswerSerializer
+    read_serializer_class = UserPollAnswerValuesSerializer
+    batch_max_size = 1000
 
     def get_queryset(self):
         if not self.request.GET.get('user_id', None):
             raise serializers.ValidationError('Empty param user_id')
-        return UserPollAnswer.objects.filter(isdelete=False, user_id=self.request.GET['user_id']).order_by('id')
+        answers = UserPollQuestionAnswer.objects.order_by('id')
+        return UserPollAnswer.objects.filter(user_id=self.request.GET['user_id']).order_by('id') \
+            .prefetch_related(Prefetch('answers', queryset=answers))
+
+    def create(self, request, *args, **kwargs):
+        """
+        A retry with the Idempotency-Key header of a stored submission gets the original response,
+        the key used with another request body gets 422.
+        In queue ingestion mode the submission is validated against cached poll metadata,
+        appended to the answer queue and stored later by the drain_answers command,
+        which also leaves out duplicate submissions. Retries with the key get the 202 response.
+        """
+        if settings.ANSWER_INGEST_MODE == 'queue':
+            submit = functools.partial(self.enqueue, request)
+        else:
+            submit = functools.partial(super(UserPollAnswerViewSet, self).create, request, *args, **kwargs)
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return submit()
+        fingerprint = request_fingerprint(request.data)
+        stored = self.idempotent_response(key, fingerprint)
+        if stored:
+            return stored
+        try:
+            # a queued submission stays queued if storing the key fails, the drainer leaves out duplicates
+            with transaction.atomic():
+                response = submit()
+                IdempotencyKey.objects.filter(key=key).delete()
+                IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, status=response.status_code,
+                                              response=json.dumps(response.data))
+        except (IntegrityError, serializers.ValidationError):
+            # a concurrent request with the same key may have stored the submission first
+            stored = self.idempotent_response(key, fingerprint)
+            if stored:
+                return stored
+            raise
+        return response
+
+    def idempotent_response(self, key, fingerprint):
+        """
+        Stored response of an unexpired key, 422 when the key was used with another request body
+        """
+        stored = idempotency_keys().filter(key=key).first()
+        if stored is None:
+            return None
+        if stored.fingerprint != fingerprint:
+            return Response({'detail': 'Idempotency-Key was already used with a different request'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(json.loads(stored.response), status=stored.status)
+
+    def validate_items(self, items, context, accepted_status, existing=None):
+        """
+        Validate batch items one by one, return per item results and (result, validated data) pairs
+        of valid items. Valid items are added to the existing live submissions when given.
+        """
+        serializer_class = self.get_serializer_class()
+        results = []
+        valid = []
+        for item in items:
+            serializer = serializer_class(data=item, context=context)
+            if serializer.is_valid():
+                try:
+                    serializer.poll_validator.check_single_answers(serializer.validated_data['answers'])
+                except serializers.ValidationError as e:
+                    results.append({'status': 400, 'errors': e.detail})
+                    continue
+                if existing is not None:
+                    existing[(serializer.validated_data['user_id'], serializer.validated_data['poll'].id)] = None
+                results.append({'status': accepted_status})
+                valid.append((results[-1], serializer.validated_data))
+            else:
+                results.append({'status': 400, 'errors': serializer.errors})
+        return results, valid
+
+    def enqueue_batch(self, request):
+        """
+        Queue ingestion mode batch: valid items are appended to the answer queue in one transaction
+        """
+        context = dict(self.get_serializer_context(),
+                       poll_validators=cached_poll_validators(submitted_poll_ids(request.data)),
+                       check_duplicates=False)
+        results, valid = self.validate_items(request.data, context, status.HTTP_202_ACCEPTED)
+        if valid:
+            answer_queue().put_many([queued_submission(data) for _, data in valid])
+        return Response({'queued': len(valid), 'failed': len(results) - len(valid), 'results': results},
+                        status=status.HTTP_202_ACCEPTED)
+
+    def enqueue(self, request):
+        poll_ids = submitted_poll_ids([request.data]) if isinstance(request.data, dict) else set()
+        context = dict(self.get_serializer_context(), poll_validators=cached_poll_validators(poll_ids),
+                       check_duplicates=False)
+        serializer = self.get_serializer_class()(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        serializer.poll_validator.check_single_answers(serializer.validated_data['answers'])
+        answer_queue().put(queued_submission(serializer.validated_data))
+        return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False)
+    def queue(self, request):
+        """
+        Answer queue depth and flush lag
+        """
+        return Response(dict(answer_queue().status(), mode=settings.ANSWER_INGEST_MODE))
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Submit a list of user answers, possibly to different polls.
+        Every item is validated and reported separately. In queue ingestion mode valid items are queued.
+        """
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError('Expected a list of user answers')
+        if len(request.data) > self.batch_max_size:
+            raise serializers.ValidationError(f'Batch size is limited to {self.batch_max_size} items')
+        if settings.ANSWER_INGEST_MODE == 'queue':
+            return self.enqueue_batch(request)
+        reject = settings.ANSWER_SUBMISSION_POLICY == 'reject'
+        existing = live_submissions(submitted_user_polls(request.data)) if reject else {}
+        context = dict(self.get_serializer_context(),
+                       poll_validators=PollAnswerValidator.for_polls(submitted_poll_ids(request.data)),
+                       live_submissions=existing)
+        results, valid = self.validate_items(request.data, context, status.HTTP_201_CREATED,
+                                             existing if reject else None)
+        try:
+            with transaction.atomic():
+                created = save_submissions([data for _, data in valid])
+        except IntegrityError:
+            # concurrent requests stored answers of some of the users first
+            unique, duplicates = without_duplicates([data for _, data in valid])
+            duplicate_ids = {id(data) for data in duplicates}
+            for result, data in valid:
+                if id(data) in duplicate_ids:
+                    result.update(status=400, errors=answered_error(data['user_id'], data['poll'].id).detail)
+            valid = [(result, data) for result, data in valid if result['status'] == 201]
+            created = save_submissions(unique)
+        for (result, _), instance in zip(valid, created):
+            result['id'] = instance.id
+        return Response({'created': len(valid), 'failed': len(results) - len(valid), 'results': results})
+
+
+class CacheStatsView(APIView):
+    """
+    Hit and miss counters of the polls cache in this process
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(stats())
@@ -0,0 +1,25 @@
+"""
+Gunicorn config of the production ASGI mode, run with:
+    gunicorn -c gunicorn.conf.py polls_service.asgi:application
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Polls cache invalidation bumps version keys in the cache itself, workers only see each other's
+# writes through a shared backend: a per process locmem cache serves stale polls and wrong 304s.
+os.environ.setdefault('POLLS_CACHE_BACKEND', 'file')
+if workers > 1 and os.environ['POLLS_CACHE_BACKEND'] == 'locmem':
+    raise RuntimeError('POLLS_CACHE_BACKEND=locmem is per process, use file with several workers')
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+keepalive = 5
+
+# Recycle workers to bound memory growth of long running processes
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+
+max_requests_jitter = max_requests // 10
@@ -5,11 +5,13 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+
+api.asgi.ASGIHandler streams responses such as poll exports from a worker thread.
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+from api.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polls_service.settings')
 
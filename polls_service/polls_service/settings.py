@@ -22,9 +22,9 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = 'yqxaknu_o=2+wc^w4bmvuts@u(tkgp#m3fg2=)ia$yqhcuf9fs'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [h for h in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if h]
 
 # Application definition
 
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +55,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'polls_service.urls'
 
+# Requests slower than this many milliseconds are logged by api.metrics with their SQL, unset disables the log
+METRICS_SLOW_REQUEST_MS = float(os.environ['METRICS_SLOW_REQUEST_MS']) if os.environ.get('METRICS_SLOW_REQUEST_MS') \
+    else None
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -75,13 +80,51 @@ WSGI_APPLICATION = 'polls_service.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DATABASE_PROFILE selects the database:
+#   sqlite     - db.sqlite3 with default journaling
+#   sqlite-wal - db.sqlite3 in WAL mode tuned by SQLITE_WAL_PRAGMAS on every new connection (api.backends.sqlite3),
+#                immediate write transactions and persistent connections
+#   postgres   - PostgreSQL configured by POSTGRES_* environment variables, persistent connections
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+
+# PRAGMA name -> value executed by api.backends.sqlite3 on every new connection
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 30000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+
+DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    'sqlite-wal': {
+        'ENGINE': 'api.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'OPTIONS': {'pragmas': SQLITE_WAL_PRAGMAS},
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'polls'),
+        'USER': os.environ.get('POSTGRES_USER', 'polls'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+    },
+}
+
+DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
 }
 
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -121,8 +164,69 @@ STATIC_URL = '/static/'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'api.authentication.CachedOAuth2Authentication',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageNumberOrKeysetPagination',
+    'PAGE_SIZE': 100,
+    # orjson based JSON, same output as rest_framework's JSONRenderer and JSONParser which it falls back to
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 100
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Validated access tokens memoized per process by api.authentication.CachedOAuth2Authentication.
+# OAUTH2_TOKEN_CACHE_TIMEOUT bounds how long a token revoked in another process stays usable here.
+OAUTH2_TOKEN_CACHE_SIZE = int(os.environ.get('OAUTH2_TOKEN_CACHE_SIZE', 10000))
+
+OAUTH2_TOKEN_CACHE_TIMEOUT = int(os.environ.get('OAUTH2_TOKEN_CACHE_TIMEOUT', 60))
+
+# Read-through cache of polls and question trees.
+# POLLS_CACHE_BACKEND=file keeps it on disk so it is shared between worker processes.
+POLLS_CACHE_ALIAS = 'polls'
+
+POLLS_CACHE_TIMEOUT = int(os.environ.get('POLLS_CACHE_TIMEOUT', 3600))
+
+POLLS_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'polls',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('POLLS_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    POLLS_CACHE_ALIAS: POLLS_CACHE_BACKENDS[os.environ.get('POLLS_CACHE_BACKEND', 'locmem')],
 }
+
+# ANSWER_INGEST_MODE=queue appends answer submissions to a durable local queue and returns 202,
+# 'manage.py drain_answers' stores them with bulk inserts.
+ANSWER_INGEST_MODE = os.environ.get('ANSWER_INGEST_MODE', 'sync')
+
+ANSWER_QUEUE_PATH = os.environ.get('ANSWER_QUEUE_PATH', os.path.join(BASE_DIR, 'answer_queue.sqlite3'))
+
+# 'manage.py archive_answers' moves answers of polls closed more than ANSWER_ARCHIVE_AFTER_DAYS days ago
+# to one SQLite file per poll in ANSWER_ARCHIVE_DIR, answer history reads them from there.
+ANSWER_ARCHIVE_DIR = os.environ.get('ANSWER_ARCHIVE_DIR', os.path.join(BASE_DIR, 'answer_archive'))
+ANSWER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ANSWER_ARCHIVE_AFTER_DAYS', 90))
+
+# A user has one live submission per poll (unique constraint on user_id and poll among non-deleted answers).
+# 'reject' refuses another submission, 'replace' soft deletes the previous submission and stores the new one.
+ANSWER_SUBMISSION_POLICY = os.environ.get('ANSWER_SUBMISSION_POLICY', 'reject')
+
+# Responses stored for Idempotency-Key retries expire after this many hours,
+# 'manage.py expire_idempotency_keys' deletes expired ones.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))